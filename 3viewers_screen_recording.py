@@ -9,6 +9,8 @@ import numpy as np
 from imageio import get_writer
 from mss import mss  # cross-platform screen capture library
 from napari_nifti._reader import napari_get_reader
+from napari_nifti._cache import VolumeCache
+from napari_nifti._lazy import read_header
 import napari
 from napari import Viewer
 
@@ -23,6 +25,8 @@ from qtpy.QtWidgets import (
 )
 from recorder import ScreenRecorder
 from viewer_module import ViewerUI
+from utils.catalog import NiftiCatalog
+from utils.viewer_ipc import ViewerServer
 from qtpy.QtWidgets import QListWidgetItem 
 
 
@@ -42,9 +46,17 @@ MAX_TEXT_DURATION = 5  # seconds of text duration
 RECTANGLE_COLOR = 'lime'  # rectangle color (green)
 RECTANGLE_WIDTH = 1 # rectangle line width
 RECORD_PATH = os.path.dirname(__file__)+'/recorded_materials/'
+ENCODER_PRESET = 'live'  # 'live' (x264 ultrafast), 'archival' (lossless FFV1) or 'proxy' (half size)
+VARIABLE_FRAME_RATE = False  # write only changed frames with their real timing, instead of a constant frame rate
+CAPTURE_SOURCE = 'screen'  # 'screen' records the whole napari window, 'canvas' only the rendered views (cheaper), None no video
+SESSION_LOG = True  # write a replayable log of slice, camera, layer and annotation changes (see replay_session.py)
+LOW_MEMORY = False  # keep only a windowed uint8 display copy of each volume (2-8x less RAM)
+CHUNKS = None  # e.g. True or (32, 128, 128): read very large acquisitions as chunked dask arrays
 
 # Initialize recorder
-recorder = ScreenRecorder(FONT_PATH=FONT_PATH, FONT_SIZE=FONT_SIZE, RECORD_PATH=RECORD_PATH, FPS=FPS, MAX_TEXT_DURATION=MAX_TEXT_DURATION)
+recorder = ScreenRecorder(FONT_PATH=FONT_PATH, FONT_SIZE=FONT_SIZE, RECORD_PATH=RECORD_PATH, FPS=FPS, MAX_TEXT_DURATION=MAX_TEXT_DURATION, ENCODER_PRESET=ENCODER_PRESET,
+                         VARIABLE_FRAME_RATE=VARIABLE_FRAME_RATE, CAPTURE_SOURCE=CAPTURE_SOURCE,
+                         SESSION_LOG=SESSION_LOG)
 recorder.text_color = TEXT_COLOR
 
 # set the file path
@@ -52,12 +64,14 @@ IMAGE_PATH = os.path.dirname(__file__)+'/data/'
 IMAGE_NAME = ["/T2G003_Spine_NIFTI/Dicoms_Spine_MRI_t2_space_sag_p2_iso_2050122160508_5001.nii.gz"]
 
 def plot():
+    # header-only metadata, served from the catalog when the file is unchanged
+    catalog = NiftiCatalog()
     for file in IMAGE_LIST:
-        img = nib.load(file)
+        info = catalog.lookup(file)
         print(f"File: {os.path.basename(file)}")
-        print(f"Data shape: {img.header.get_data_shape()}")
-        print(f"Voxel size (mm): {img.header.get_zooms()}")
-        print(f"Orientation: {nib.orientations.aff2axcodes(img.affine)}\n")
+        print(f"Data shape: {info['shape']}")
+        print(f"Voxel size (mm): {info['voxel_size']}")
+        print(f"Orientation: {info['orientation']}\n")
 
 def main():
     previous_length = 0
@@ -81,6 +95,7 @@ def main():
     image_name = os.path.splitext(rel_path)[0].replace('/', '_').replace('\\', '_')
     recorder.image_name = image_name
     recorder.image_name = image_name
+    recorder.source_path = filepath
 
     # read the image data
     reader = napari_get_reader(filepath)
@@ -88,7 +103,10 @@ def main():
         print("Can't find a reader for the file")
         sys.exit()
 
-    layer_data = reader(filepath)
+    # lazy: only the slices shown in the viewer are read from disk
+    # cache: .nii.gz files are only gunzipped on their first open
+    volume_cache = VolumeCache()
+    layer_data = reader(filepath, lazy=True, cache=volume_cache, chunks=CHUNKS)
     if not layer_data:
         print("not layer data")
         sys.exit()
@@ -98,9 +116,25 @@ def main():
     metadata = layer_data[0][1]
 
     viewer3d = ViewerUI(image_array=image_array, metadata=metadata, filepath=filepath, \
-                    recorder=recorder, RECORD_PATH=RECORD_PATH)
+                    recorder=recorder, RECORD_PATH=RECORD_PATH, volume_cache=volume_cache, \
+                    display_dtype=np.uint8 if LOW_MEMORY else None)
+    # the viewer holds the only reference it needs (the display copy in low-memory mode)
+    del layer_data, image_array
     viewer = viewer3d.get_viewer()
 
+    # further series of the same study (e.g. transversal/coronal acquisitions) follow the cursor
+    linked_paths = []
+    for name in sys.argv[2:]:
+        path = os.path.join(IMAGE_PATH, name.strip('"'))
+        if os.path.exists(path):
+            linked_paths.append(path)
+        else:
+            print(f"File path does not exist: {path}")
+    if linked_paths:
+        for (linked_array, linked_meta, _), path, colormap in zip(
+                reader(linked_paths, lazy=True, cache=volume_cache, chunks=CHUNKS), linked_paths, ['magenta', 'green', 'cyan', 'yellow']):
+            viewer3d.add_linked_series(path, linked_array, linked_meta['affine'], colormap=colormap)
+
     def calculate_base_scale(image_shape, screen_size):
         """Calculate base scaling ratio based on image dimensions and screen space"""
         screen_width = screen_size[0] // 2  
@@ -122,9 +156,6 @@ def main():
     # # Apply scaling parameters to view
     # viewer3d.apply_layout_settings()
 
-    def update_slices(event):
-        viewer3d._update_slices(event)
-        
     viewer = viewer3d.get_viewer()
     # points_layer = viewer3d.get_points_layer()
 
@@ -144,8 +175,7 @@ def main():
         print("start recording automatically...")
     ])
     
-    # Connect dimension updates
-    viewer.dims.events.current_step.connect(update_slices)
+    # dimension updates are connected (and coalesced) inside ViewerUI
 
     # # Add points layer and other existing logic
     # points_layer = viewer.add_points(
@@ -447,22 +477,74 @@ def main():
             item.setFlags(item.flags() | Qt.TextWordWrap)  # Enable text wrapping
             rect_list.addItem(item)
 
-    @viewer.bind_key('D')  # Press R key to open 3D view
+    @viewer.bind_key('D')  # Press D key to open 3D view
     def open_3d_view(viewer):
-        """Open 3D view window"""
-        import subprocess
+        """Open 3D view window, in this process and on the already loaded volume"""
+        print("Opening 3D view...")
+        viewer3d.show_3d_preview()
+
+    @viewer.bind_key('V')  # Press V to show/hide the curved planar reformation
+    def toggle_cpr(viewer):
+        viewer3d.toggle_cpr()
+
+    def open_file(new_filepath):
+        """Swap the volume shown in this window instead of starting a new process"""
+        nonlocal file_name
+        try:
+            reader = napari_get_reader(new_filepath)
+            if not reader:
+                raise ValueError("no reader for this file type")
+            layer_data = reader(new_filepath, lazy=True, cache=volume_cache, chunks=CHUNKS)
+        except Exception as e:
+            # the previous study stays open (and recorded) unchanged
+            print(f"Could not open {new_filepath}: {str(e)}")
+            viewer3d.get_status_label().setText(f"Could not open {os.path.basename(new_filepath)}: {str(e)}")
+            return
+
+        # close the recording of the previous file, the new one gets its own video and log
+        was_recording = recorder.is_recording
+        if was_recording:
+            save_all_annotations()
+            recorder.stop_recording()
+
         try:
-            subprocess.Popen([
-                sys.executable,
-                os.path.join(os.path.dirname(__file__), 'show_3d_view.py'),
-                file_name  # Use current opened file
-            ], shell=False)
-            print("Opening 3D view...")
+            viewer3d.load_volume(layer_data[0][0], layer_data[0][1], new_filepath)
         except Exception as e:
-            print(f"Failed to launch 3D view: {str(e)}")
+            print(f"Could not open {new_filepath}: {str(e)}")
+            viewer3d.get_status_label().setText(f"Could not open {os.path.basename(new_filepath)}: {str(e)}")
+            return
+        file_name = new_filepath
+        rel_path = os.path.relpath(new_filepath, IMAGE_PATH)
+        recorder.image_name = os.path.splitext(rel_path)[0].replace('/', '_').replace('\\', '_')
+        recorder.source_path = new_filepath
+
+        if was_recording:
+            recorder.start_recording(viewer)
+        viewer.window._qt_window.raise_()
+        viewer.window._qt_window.activateWindow()
+        print(f"Opened {new_filepath}")
+
+    def handle_open(request):
+        new_filepath = os.path.join(IMAGE_PATH, request['path'].strip('"'))
+        if not os.path.exists(new_filepath):
+            raise FileNotFoundError(f"File path does not exist: {new_filepath}")
+        if not napari_get_reader(new_filepath):
+            raise ValueError(f"Can't find a reader for the file: {new_filepath}")
+        # header only: an unreadable file is refused here, so the navigator starts its own process instead
+        info = read_header(new_filepath)
+        if len(info['shape']) < 3:
+            raise ValueError(f"Expected a 3D volume, got shape {info['shape']}")
+        # reply to the navigator right away and load on the next event loop tick
+        QTimer.singleShot(0, lambda: open_file(new_filepath))
+
+    # let the navigator reuse this window for the next file
+    viewer_server = ViewerServer({'open': handle_open})
 
     # automatically stop recording when the window is closed
     def on_close(event):
+        viewer_server.close()
+        if viewer3d.preview_3d is not None:
+            viewer3d.preview_3d.close()
         if recorder.is_recording:
             save_all_annotations() 
             recorder.stop_recording()
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+
+from slice_engine import sample_volume
+
+CPR_WIDTH_MM = 60.0  # extent of the straightened image across the canal
+CPR_STEP_MM = 0.5  # sample spacing along and across the centreline
+CACHE_GRIDS = 8  # sampling grids kept per reformation
+CENTRELINE_STEP = 8  # axial slices between automatically estimated centreline points
+
+
+def estimate_centreline(volume, step=CENTRELINE_STEP):
+    """Estimate the spinal canal centreline of a T2 volume (z, y, x) in voxel coordinates.
+
+    On T2 the CSF around the cord is the brightest structure near the midline,
+    so every ``step`` axial slices the centroid of the brightest voxels in the
+    central half of the slice is taken, and the resulting curve is smoothed
+    along z. This is a heuristic starting point the user can correct by
+    dragging the control points.
+    """
+    nz, ny, nx = volume.shape[:3]
+    x0, x1 = nx // 4, nx - nx // 4
+    y0, y1 = ny // 4, ny - ny // 4
+    points = []
+    for z in range(step // 2, nz, step):
+        region = np.asarray(volume[z, y0:y1, x0:x1], dtype=np.float32)
+        threshold = np.percentile(region, 99)
+        ys, xs = np.nonzero(region >= threshold)
+        if len(ys) == 0:
+            continue
+        points.append((z, ys.mean() + y0, xs.mean() + x0))
+    points = np.array(points, dtype=np.float64)
+    if len(points) >= 3:
+        points[:, 1:] = uniform_filter1d(points[:, 1:], size=3, axis=0, mode='nearest')
+    return points
+
+
+class CurvedPlanarReformation:
+    """Straightened image of a volume along a curved centreline.
+
+    Control points are given in voxel coordinates (z, y, x) and interpolated
+    by a cubic spline in physical (mm) space, then resampled at equal arc
+    length. Each output row is one centreline position and each column an
+    offset along the anterior-posterior normal of the curve; ``offset`` moves
+    the whole surface along the left-right binormal. The sampling grid of a
+    centreline is computed once (a few vectorized array operations) and kept
+    in an LRU cache, so re-rendering is a single ``map_coordinates`` call.
+    """
+
+    def __init__(self, volume, spacing=(1.0, 1.0, 1.0), width_mm=CPR_WIDTH_MM, step_mm=CPR_STEP_MM):
+        # lazy and chunked volumes are only read around the centreline
+        self.volume = volume
+        self.region = {}  # last region read from a lazy volume, see sample_volume
+        self.spacing = np.asarray(spacing, dtype=np.float64)
+        self.width_mm = width_mm
+        self.step_mm = step_mm
+        self.grids = OrderedDict()  # {centreline key: (base grid, binormals)}
+
+    def grid(self, points):
+        """Return the sampling grid (3, rows, columns) in voxel coordinates and the per-row binormals"""
+        points = np.asarray(points, dtype=np.float64)
+        key = tuple(np.round(points, 2).ravel())
+        cached = self.grids.get(key)
+        if cached is not None:
+            self.grids.move_to_end(key)
+            return cached
+        cached = self._build_grid(points)
+        self.grids[key] = cached
+        while len(self.grids) > CACHE_GRIDS:
+            self.grids.popitem(last=False)
+        return cached
+
+    def _build_grid(self, points):
+        from scipy.interpolate import CubicSpline
+
+        # order along z and merge control points on the same slice
+        points = points[np.argsort(points[:, 0])]
+        z, index = np.unique(points[:, 0], return_index=True)
+        points = points[index] * self.spacing
+        if len(points) < 2:
+            raise ValueError("A curved reformation needs at least two centreline points")
+        # spline through the control points, parametrised by cumulative chord length
+        chord = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+        spline = CubicSpline(chord, points, bc_type='natural') if len(points) > 2 else None
+        dense_t = np.linspace(0.0, chord[-1], max(int(chord[-1] / self.step_mm) * 4, 2))
+        dense = spline(dense_t) if spline is not None else points[0] + np.outer(dense_t / chord[-1], points[1] - points[0])
+        # resample at equal arc length
+        arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(dense, axis=0), axis=1))])
+        samples = np.arange(0.0, arc[-1], self.step_mm)
+        centre = np.stack([np.interp(samples, arc, dense[:, i]) for i in range(3)], axis=1)
+        tangent = np.gradient(centre, axis=0)
+        tangent /= np.maximum(np.linalg.norm(tangent, axis=1, keepdims=True), 1e-9)
+        # anterior-posterior normal: the y axis with its tangential component removed
+        normal = np.array([0.0, 1.0, 0.0]) - tangent[:, 1:2] * tangent
+        normal /= np.maximum(np.linalg.norm(normal, axis=1, keepdims=True), 1e-9)
+        binormal = np.cross(tangent, normal)
+        across = np.arange(-self.width_mm / 2, self.width_mm / 2, self.step_mm)
+        # (rows, columns, 3) positions in mm, then voxel coordinates first for map_coordinates
+        grid = centre[:, None, :] + across[None, :, None] * normal[:, None, :]
+        grid = np.moveaxis(grid / self.spacing, -1, 0)
+        binormal = np.moveaxis(binormal / self.spacing, -1, 0)[:, :, None]
+        return grid, binormal
+
+    def render(self, points, offset=0.0):
+        """Resample the straightened image for a centreline, ``offset`` mm along the binormal"""
+        grid, binormal = self.grid(points)
+        coords = grid + offset * binormal if offset else grid
+        return sample_volume(self.volume, coords, region=self.region)
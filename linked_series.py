@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+import numpy as np
+from slice_engine import VIEW_AXES, DISPLAY_AXES, sample_volume
+
+CACHE_SLICES = 32  # resampled slices kept per linked series
+
+
+class LinkedSeries:
+    """Another series of the same study, resampled onto the planes of the reference volume.
+
+    Both affines are the ``reader_function`` ones (array index (z, y, x) to
+    physical space), so ``transform = inv(affine) @ reference_affine`` maps a
+    reference voxel to this series' voxel coordinates. It is computed once.
+    For every reference view the sampling grid of slice 0 (in display
+    orientation) is mapped through it once as well; slice ``index`` of the
+    view is then that grid plus ``index`` times one column of the transform,
+    so a linked step costs one vectorized ``map_coordinates`` call. Recently
+    resampled slices are kept in a small LRU cache for back-and-forth scrolling.
+    """
+
+    def __init__(self, name, volume, affine, reference_affine, reference_shape):
+        self.name = name
+        # lazy and chunked volumes are only read where a plane crosses them
+        self.volume = volume
+        # {view: last region read from a lazy volume}, see sample_volume; the three views
+        # cut the volume along different axes, one shared region would be replaced on every render
+        self.regions = {}
+        self.reference_shape = tuple(reference_shape[:3])
+        self.transform = np.linalg.inv(np.asarray(affine, dtype=np.float64)) @ np.asarray(reference_affine, dtype=np.float64)
+        self.grids = {}  # {view: base grid (3, rows, columns) in this series' voxel coordinates}
+        self.slices = OrderedDict()  # {(view, index): resampled slice}
+
+    def map_point(self, step):
+        """Map a reference voxel position (z, y, x) to this series' voxel position"""
+        return self.transform[:3, :3] @ np.asarray(step[:3], dtype=np.float64) + self.transform[:3, 3]
+
+    def contains(self, step):
+        """Whether a reference voxel position falls inside this series"""
+        point = self.map_point(step)
+        return bool(np.all(point >= -0.5) and np.all(point <= np.array(self.volume.shape[:3]) - 0.5))
+
+    def _grid(self, view):
+        grid = self.grids.get(view)
+        if grid is None:
+            row_axis, col_axis = DISPLAY_AXES[view]
+            n_rows, n_cols = self.reference_shape[row_axis], self.reference_shape[col_axis]
+            rows, cols = np.meshgrid(np.arange(n_rows), np.arange(n_cols), indexing='ij')
+            points = np.zeros((3, n_rows, n_cols))
+            points[row_axis] = n_rows - 1 - rows  # rows are displayed flipped
+            points[col_axis] = cols
+            grid = np.tensordot(self.transform[:3, :3], points, axes=1) + self.transform[:3, 3, None, None]
+            grid = self.grids[view] = grid.astype(np.float32)
+        return grid
+
+    def get(self, view, index):
+        """Return this series resampled onto slice ``index`` of a reference view"""
+        key = (view, int(index))
+        data = self.slices.get(key)
+        if data is not None:
+            self.slices.move_to_end(key)
+            return data
+        step = self.transform[:3, VIEW_AXES[view], None, None].astype(np.float32)
+        coords = self._grid(view) + step * np.float32(index)
+        data = sample_volume(self.volume, coords, region=self.regions.setdefault(view, {}))
+        self.slices[key] = data
+        while len(self.slices) > CACHE_SLICES:
+            self.slices.popitem(last=False)
+        return data
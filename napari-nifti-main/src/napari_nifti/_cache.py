@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "NAPARI_NIFTI_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "napari-nifti"),
+)
+# total size the cache may grow to before the least recently used entries are deleted
+DEFAULT_MAX_BYTES = int(float(os.environ.get("NAPARI_NIFTI_CACHE_MAX_GB", "20")) * 1024 ** 3)
+
+
+class VolumeCache:
+    """On-disk cache of decoded volumes.
+
+    Compressed files (``.nii.gz``, ``.nrrd``) are transcoded once into an
+    uncompressed ``.npy`` file plus a ``.json`` file with the geometry, so
+    later opens skip gzip inflation entirely and can memory-map the array.
+    Entries are keyed by the absolute path, modification time and size of the
+    source file; an entry for an older version of the same file is removed
+    when a new one is written.
+
+    Every file written for a source file version (the volume, pyramid levels,
+    reoriented stacks, meshes...) belongs to one entry. Reading a file marks
+    its entry as used, and after each write the least recently used entries
+    are deleted until the cache is at most ``max_bytes`` large (20 GB unless
+    ``NAPARI_NIFTI_CACHE_MAX_GB`` says otherwise). ``clear()`` empties it.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def _entry(self, path):
+        """Return the file prefix for ``path``'s current version and the prefix shared by all its versions."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        path_hash = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+        state_hash = hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{path_hash}_{state_hash}"), f"{path_hash}_"
+
+    def path_for(self, path, suffix):
+        """Path of an auxiliary cache file (e.g. a pyramid level) belonging to ``path``."""
+        return f"{self._entry(path)[0]}{suffix}"
+
+    def load(self, path, mmap=True):
+        """Return ``(array, metadata)`` for a cached file, or None on a cache miss."""
+        entry, _ = self._entry(path)
+        if not (os.path.exists(entry + ".json") and os.path.exists(entry + ".npy")):
+            return None
+        try:
+            with open(entry + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            array = np.load(entry + ".npy", mmap_mode="r" if mmap else None)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring broken cache entry {entry}: {str(e)}")
+            return None
+        _touch(entry + ".json")
+        metadata = {
+            "spacing": np.array(meta["spacing"]),
+            "origin": np.array(meta["origin"]),
+            "direction": np.array(meta["direction"]),
+            "header": meta["header"],
+        }
+        return array, metadata
+
+    def store(self, path, array, metadata):
+        """Write ``array`` and its geometry to the cache and drop older entries of ``path``."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry, prefix = self._entry(path)
+        self._remove_stale(prefix, keep=os.path.basename(entry))
+        _save_npy(entry + ".npy", array)
+        meta = {
+            "spacing": np.asarray(metadata["spacing"]).tolist(),
+            "origin": np.asarray(metadata["origin"]).tolist(),
+            "direction": np.asarray(metadata["direction"]).tolist(),
+            "header": metadata["header"],
+        }
+        with open(entry + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(entry + ".json.tmp", entry + ".json")
+        self.evict(keep=os.path.basename(entry))
+
+    def load_array(self, path, suffix, mmap=True):
+        """Return an auxiliary array (e.g. a pyramid level) cached for ``path``, or None."""
+        filename = self.path_for(path, suffix)
+        if not os.path.exists(filename):
+            return None
+        try:
+            array = np.load(filename, mmap_mode="r" if mmap else None)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring broken cache file {filename}: {str(e)}")
+            return None
+        _touch(filename)
+        return array
+
+    def store_array(self, path, suffix, array):
+        """Cache an auxiliary array for the current version of ``path``."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry, prefix = self._entry(path)
+        self._remove_stale(prefix, keep=os.path.basename(entry))
+        _save_npy(entry + suffix, array)
+        self.evict(keep=os.path.basename(entry))
+
+    def create_array(self, path, suffix, shape, dtype, fill):
+        """Build an auxiliary array directly on disk and return it memory-mapped.
+
+        ``fill(out)`` receives a writable memory-mapped array of the given
+        shape and dtype, so arrays larger than RAM can be written slab by slab.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry, prefix = self._entry(path)
+        self._remove_stale(prefix, keep=os.path.basename(entry))
+        filename = entry + suffix
+        out = np.lib.format.open_memmap(filename + ".tmp", mode="w+", dtype=dtype, shape=shape)
+        try:
+            fill(out)
+            out.flush()
+        except BaseException:
+            # e.g. a build cancelled by its caller, never leave a partial file behind
+            del out
+            os.remove(filename + ".tmp")
+            raise
+        del out
+        os.replace(filename + ".tmp", filename)
+        self.evict(keep=os.path.basename(entry))
+        return np.load(filename, mmap_mode="r")
+
+    def touch(self, path, suffix=""):
+        """Mark the entry of ``path`` as recently used, for files read via ``path_for``."""
+        _touch(self.path_for(path, suffix))
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits in ``max_bytes``.
+
+        Parameters
+        ----------
+        keep : str, optional
+            Entry prefix (``<path hash>_<state hash>``) that is never deleted,
+            e.g. the one just written.
+
+        Returns
+        -------
+        int
+            Number of bytes freed.
+        """
+        if not self.max_bytes or not os.path.isdir(self.cache_dir):
+            return 0
+        entries = {}  # {entry prefix: [size, last use, [file names]]}
+        for dir_entry in os.scandir(self.cache_dir):
+            # names start with "<16 hex path hash>_<16 hex state hash>", see _entry
+            if not dir_entry.is_file() or len(dir_entry.name) < 33 or dir_entry.name[16] != "_":
+                continue
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            info = entries.setdefault(dir_entry.name[:33], [0, 0.0, []])
+            info[0] += stat.st_size
+            info[1] = max(info[1], stat.st_mtime)
+            info[2].append(dir_entry.name)
+        total = sum(info[0] for info in entries.values())
+        freed = 0
+        for prefix, (size, _, names) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total - freed <= self.max_bytes:
+                break
+            if prefix == keep:
+                continue
+            for name in names:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass  # e.g. still memory-mapped on Windows, retried on the next write
+            freed += size
+        return freed
+
+    def clear(self):
+        """Delete every entry of the cache."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _remove_stale(self, prefix, keep):
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and not name.startswith(keep):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+
+def _touch(filename):
+    """Update the modification time of a cache file, which ``evict`` uses as its last use."""
+    try:
+        os.utime(filename)
+    except OSError:
+        pass
+
+
+def _save_npy(filename, array):
+    """Write ``array`` under a temporary name first so an interrupted run never leaves a half-written file."""
+    with open(filename + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(filename + ".tmp", filename)
@@ -0,0 +1,154 @@
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import dask.array as da
+except ImportError:  # chunked reading is optional
+    da = None
+
+# chunk shape (z, y, x) used when chunked reading is requested without one
+DEFAULT_CHUNKS = (32, 128, 128)
+
+
+def supports_lazy(path):
+    """Whether ``path`` can be read lazily without being slower than a full decode.
+
+    Uncompressed ``.nii`` files are memory-mapped. A ``.nii.gz`` file only
+    supports random access with ``indexed_gzip``; without it every slice
+    re-inflates the gzip stream from the start, which for a typical volume is
+    10-25x slower than decoding it once.
+
+    Parameters
+    ----------
+    path : str
+        Path to an image file.
+
+    Returns
+    -------
+    bool
+        True for ``.nii`` files, and for ``.nii.gz`` files if ``indexed_gzip``
+        is installed.
+    """
+    if path.endswith(".nii"):
+        return True
+    if path.endswith(".nii.gz"):
+        try:
+            import indexed_gzip  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    return False
+
+
+def read_header(path):
+    """Read the image geometry of a file without decoding its voxel data.
+
+    Parameters
+    ----------
+    path : str
+        Path to a NIfTI or NRRD file.
+
+    Returns
+    -------
+    dict
+        The "shape", "spacing", "origin", "direction" and "header" of the
+        image, in the same (z, y, x) axis order that ``MedVol`` uses.
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(str(path))
+    reader.ReadImageInformation()
+    ndims = reader.GetDimension()
+    return {
+        "shape": tuple(reader.GetSize()[::-1]),
+        "spacing": np.array(reader.GetSpacing()[::-1]),
+        "origin": np.array(reader.GetOrigin()[::-1]),
+        "direction": np.array(reader.GetDirection()[::-1]).reshape(ndims, ndims),
+        "header": {key: reader.GetMetaData(key) for key in reader.GetMetaDataKeys()},
+    }
+
+
+def affine_from_header(spacing, origin, direction):
+    """Compose the affine matrix the same way ``MedVol.affine`` does."""
+    ndims = len(spacing)
+    affine = np.eye(ndims + 1)
+    affine[:ndims, :ndims] = direction @ np.diag(spacing)
+    affine[:ndims, ndims] = origin
+    return affine
+
+
+class LazyNiftiArray:
+    """Array-like view on a NIfTI file that only reads the voxels it is indexed with.
+
+    Uncompressed ``.nii`` files are memory-mapped by nibabel, so a slice costs
+    only the bytes it covers. For ``.nii.gz`` files the gzip stream is decoded
+    on demand up to the requested voxels, which is only fast with
+    ``indexed_gzip`` (see ``supports_lazy``). Axes are reversed so that
+    indexing matches the (z, y, x) arrays returned by ``MedVol``, and slices
+    are returned in native byte order like ``MedVol`` arrays.
+    """
+
+    def __init__(self, path):
+        try:
+            import nibabel as nib
+        except ImportError as e:
+            raise ImportError("Lazy loading requires nibabel: pip install nibabel") from e
+        self.path = str(path)
+        self._proxy = nib.load(self.path, mmap=True).dataobj
+        self.shape = tuple(self._proxy.shape[::-1])
+        self.ndim = len(self.shape)
+        # slope/intercept scaling may promote the on-disk dtype, so ask for one voxel
+        self.dtype = np.asarray(self._proxy[(slice(0, 1),) * self.ndim]).dtype.newbyteorder("=")
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        # big-endian files are swapped here, so consumers never convert each slice themselves
+        data = np.asarray(self._proxy[key[::-1]]).astype(self.dtype, copy=False)
+        # the remaining (non-integer) axes come back in file order, i.e. reversed
+        return data.transpose()
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return f"LazyNiftiArray({self.path!r}, shape={self.shape}, dtype={self.dtype})"
+
+
+def as_chunked(array, chunks=True):
+    """Wrap an array-like volume in a dask array that reads one chunk at a time.
+
+    Parameters
+    ----------
+    array : array-like
+        Volume supporting slicing, e.g. a ``LazyNiftiArray`` or a memory-mapped
+        cache entry.
+    chunks : bool or tuple of int
+        Chunk shape; True uses ``DEFAULT_CHUNKS`` (clipped to the array shape).
+
+    Returns
+    -------
+    dask.array.Array
+        Lazy array whose slices and reductions only read the chunks they touch.
+    """
+    if da is None:
+        raise ImportError("Chunked reading requires dask: pip install 'dask[array]'")
+    if chunks is True:
+        chunks = DEFAULT_CHUNKS[:len(array.shape)]
+    # each chunk is read through the array's own __getitem__, never through __array__
+    return da.from_array(array, chunks=chunks, asarray=False, fancy=False)
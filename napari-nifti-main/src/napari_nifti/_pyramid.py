@@ -0,0 +1,57 @@
+import numpy as np
+
+# levels are not built below this edge length, napari gains nothing from them
+MIN_LEVEL_SIZE = 16
+
+
+def downsample(array, factor=2, slab=32):
+    """Block-average ``array`` by ``factor`` along every axis.
+
+    The input is read in slabs along the first axis, so lazy or memory-mapped
+    arrays are never materialized as a whole. Trailing voxels that do not fill
+    a complete block are dropped.
+    """
+    shape = tuple(s // factor for s in array.shape)
+    out = np.empty(shape, dtype=array.dtype)
+    step = max(1, slab // factor) * factor
+    for start in range(0, shape[0] * factor, step):
+        stop = min(start + step, shape[0] * factor)
+        block = np.asarray(array[start:stop])
+        block = block[(slice(None),) + tuple(slice(0, s * factor) for s in shape[1:])]
+        # (z, y, x) -> (z, f, y, f, x, f) and average over the f axes
+        split = [d for s in block.shape for d in (s // factor, factor)]
+        reduced = block.reshape(split).mean(axis=tuple(range(1, 2 * block.ndim, 2)))
+        out[start // factor:stop // factor] = reduced.astype(array.dtype, copy=False)
+    return out
+
+
+def build_pyramid(array, levels=3, cache=None, path=None):
+    """Return ``[array, array/2, array/4, ...]`` for napari multiscale display.
+
+    Parameters
+    ----------
+    array : array-like
+        Full resolution volume.
+    levels : int
+        Number of downsampled levels (3 gives 2x, 4x and 8x).
+    cache : VolumeCache, optional
+        If given together with ``path``, levels are read from and written to
+        the on-disk cache so they are only computed once per file version.
+    path : str, optional
+        Source file of ``array``, used as the cache key.
+    """
+    pyramid = [array]
+    for level in range(1, levels + 1):
+        if min(pyramid[-1].shape) // 2 < MIN_LEVEL_SIZE:
+            break
+        suffix = f"_level{level}.npy"
+        data = cache.load_array(path, suffix) if cache and path else None
+        if data is None:
+            data = downsample(pyramid[-1])
+            if cache and path:
+                try:
+                    cache.store_array(path, suffix, data)
+                except OSError as e:
+                    print(f"Could not cache pyramid level {level} of {path}: {str(e)}")
+        pyramid.append(data)
+    return pyramid
@@ -1,5 +1,12 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from medvol import MedVol
 
+from ._cache import VolumeCache
+from ._lazy import LazyNiftiArray, affine_from_header, as_chunked, read_header, supports_lazy
+from ._pyramid import build_pyramid
+
 def napari_get_reader(path):
     """A basic implementation of a Reader contribution.
 
@@ -28,7 +35,7 @@ def napari_get_reader(path):
     return reader_function
 
 
-def reader_function(path):
+def reader_function(path, lazy=False, cache=False, multiscale=False, workers=None, chunks=None):
     """Take a path or list of paths and return a list of LayerData tuples.
 
     Readers are expected to return data as a list of tuples, where each tuple
@@ -39,6 +46,28 @@ def reader_function(path):
     ----------
     path : str or list of str
         Path to file, or list of paths.
+    lazy : bool
+        If True, NIfTI files are returned as a ``LazyNiftiArray`` that only
+        reads the slices that are actually indexed (memory-mapped for
+        uncompressed ``.nii``) instead of decoding the whole volume up front.
+        ``.nii.gz`` files are only read lazily if ``indexed_gzip`` is
+        installed, and eagerly otherwise (or memory-mapped from ``cache``).
+        NRRD files are always loaded eagerly.
+    cache : bool or VolumeCache
+        If set, compressed files are transcoded into an uncompressed on-disk
+        cache on first open and read (memory-mapped when ``lazy``) from there
+        afterwards. Pass a ``VolumeCache`` to use a non-default directory.
+    multiscale : bool or int
+        If set, each image is returned as a list of 2x, 4x and 8x downsampled
+        levels (or as many levels as the int given) for napari multiscale
+        display. Levels are cached on disk when ``cache`` is enabled.
+    workers : int, optional
+        Number of threads used to load a list of paths concurrently. Defaults
+        to one per file, capped at the CPU count; 1 loads them sequentially.
+    chunks : bool or tuple of int, optional
+        If set, volumes are returned as dask arrays with this chunk shape (True
+        for ``DEFAULT_CHUNKS``), so slicing, statistics and projections only
+        read the chunks they touch. Best combined with ``lazy``; requires dask.
 
     Returns
     -------
@@ -53,9 +82,60 @@ def reader_function(path):
     # handle both a string and a list of strings
     paths = [path] if isinstance(path, str) else path
     # load all files
-    image_data_list = [MedVol(_path) for _path in paths]
-    # Convert to LayerData tuples
-    layer_data = [(image_data.array, {"affine": image_data.affine, 
-                                      "metadata": {"spacing": image_data.spacing, "origin": image_data.origin, "direction": image_data.direction, "header": image_data.header}}, "image")
-                  for image_data in image_data_list]
+    if cache is True:
+        cache = VolumeCache()
+    levels = 0 if not multiscale else 3 if multiscale is True else int(multiscale)
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    if workers <= 1 or len(paths) <= 1:
+        return [_load_layer(_path, lazy, cache, levels, chunks) for _path in paths]
+    # decoding is dominated by zlib/ITK code that releases the GIL, so threads overlap well
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        layer_data = list(executor.map(lambda _path: _load_layer(_path, lazy, cache, levels, chunks), paths))
     return layer_data
+
+
+def _load_layer(path, lazy=False, cache=None, levels=0, chunks=None):
+    """Load a single file into a LayerData tuple."""
+    if cache and not path.endswith(".nii"):
+        # uncompressed .nii files are memory-mapped directly and never need the cache
+        array, meta = _load_cached(path, lazy, cache)
+        spacing, origin, direction, header = meta["spacing"], meta["origin"], meta["direction"], meta["header"]
+        affine = affine_from_header(spacing, origin, direction)
+    elif lazy and supports_lazy(path):
+        info = read_header(path)
+        array = LazyNiftiArray(path)
+        affine = affine_from_header(info["spacing"], info["origin"], info["direction"])
+        spacing, origin, direction, header = info["spacing"], info["origin"], info["direction"], info["header"]
+    else:
+        image_data = MedVol(path)
+        array, affine = image_data.array, image_data.affine
+        spacing, origin, direction, header = image_data.spacing, image_data.origin, image_data.direction, image_data.header
+    if chunks:
+        array = as_chunked(array, chunks)
+    meta = {"affine": affine,
+            "metadata": {"spacing": spacing, "origin": origin, "direction": direction, "header": header}}
+    if levels:
+        return (build_pyramid(array, levels, cache=cache or None, path=path), dict(meta, multiscale=True), "image")
+    return (array, meta, "image")
+
+
+def _load_cached(path, lazy, cache):
+    """Read a volume from ``cache``, transcoding it on a miss."""
+    entry = cache.load(path, mmap=lazy)
+    if entry is not None:
+        return entry
+    image_data = MedVol(path)
+    meta = {"spacing": image_data.spacing, "origin": image_data.origin,
+            "direction": image_data.direction, "header": image_data.header}
+    try:
+        cache.store(path, image_data.array, meta)
+    except OSError as e:
+        print(f"Could not write volume cache for {path}: {str(e)}")
+        return image_data.array, meta
+    if lazy:
+        # hand out the memory-mapped copy so the decoded array can be released,
+        # unless a parallel read has already evicted the entry again
+        entry = cache.load(path, mmap=True)
+        if entry is not None:
+            return entry
+    return image_data.array, meta
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the viewer modules tested next to the reader live in the project root
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
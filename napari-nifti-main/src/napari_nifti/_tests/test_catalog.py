@@ -0,0 +1,48 @@
+import os
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from utils.catalog import NiftiCatalog, parse_sequence_name
+
+
+@pytest.mark.parametrize(
+    "filename, sequence",
+    [
+        ("Dicoms_Spine_MRI_t2_space_sag_p2_iso_2050122160508_5001.nii.gz", "t2_space_sag_p2_iso"),
+        ("T2G002_MRI_Spine_t2_space_sag_p2_iso_20240820161941_19001.nii.gz", "t2_space_sag_p2_iso"),
+        ("T2G003_Spine_MRI_t2_space_sag_p2_iso_20250122160508_5001.nii", "t2_space_sag_p2_iso"),
+        ("T1G001_MRI_Spine_t1_tse_sag_20240820161941_3001.nii.gz", "t1_tse_sag"),
+        ("sub-01_ses-01_T2w.nii.gz", "T2w"),
+    ],
+)
+def test_parse_sequence_name(filename, sequence):
+    assert parse_sequence_name(os.path.join("data", filename)) == sequence
+
+
+def test_catalog_invalidated_by_mtime(tmp_path):
+    path = str(tmp_path / "T2G002_MRI_Spine_t2_space_sag_p2_iso_20240820161941_19001.nii")
+    nib.save(nib.Nifti1Image(np.zeros((4, 5, 6), dtype=np.int16), np.diag([0.5, 0.5, 2.0, 1.0])), path)
+    catalog = NiftiCatalog(str(tmp_path / "catalog.sqlite"))
+    try:
+        assert catalog.get(path) is None
+        info = catalog.lookup(path)
+        assert info == {
+            "shape": "4x5x6",
+            "voxel_size": "0.50x0.50x2.00",
+            "orientation": "RAS",
+            "dtype": "int16",
+            "sequence": "t2_space_sag_p2_iso",
+        }
+        assert catalog.get(path) == info
+
+        nib.save(nib.Nifti1Image(np.zeros((4, 5, 7), dtype=np.int16), np.eye(4)), path)
+        os.utime(path, (0, 0))
+        assert catalog.get(path) is None
+        assert catalog.lookup(path)["shape"] == "4x5x7"
+
+        catalog.remove(path)
+        assert catalog.get(path) is None
+    finally:
+        catalog.close()
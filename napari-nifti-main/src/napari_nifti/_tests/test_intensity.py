@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from utils.intensity import PERCENTILES, compute_intensity_statistics, percentile_from_histogram, quantize_volume
+
+
+@pytest.fixture
+def volume():
+    rng = np.random.default_rng(0)
+    data = rng.gamma(4.0, 100.0, size=(24, 32, 32)).astype(np.float32)
+    data[:, :8] = 0  # air background
+    return data
+
+
+def test_percentiles_match_numpy(volume):
+    stats = compute_intensity_statistics(volume)
+    foreground = volume[volume != 0]
+    bin_width = (stats["bin_edges"][1] - stats["bin_edges"][0]) / len(stats["histogram"])
+    for q in PERCENTILES:
+        assert abs(stats["percentiles"][str(q)] - np.percentile(foreground, q)) <= bin_width
+    assert stats["background_voxels"] == volume.size - foreground.size
+    assert sum(stats["histogram"]) == foreground.size
+    assert stats["min"] == 0.0 and stats["max"] == pytest.approx(float(volume.max()))
+
+
+def test_negative_data_keeps_zeros():
+    data = np.linspace(-100, 100, 2001, dtype=np.float32).reshape(1, 1, -1)
+    stats = compute_intensity_statistics(data)
+    assert stats["background_voxels"] == 0
+    assert stats["percentiles"]["50"] == pytest.approx(0.0, abs=0.2)
+
+
+def test_constant_volume_falls_back_to_full_range():
+    stats = compute_intensity_statistics(np.zeros((4, 4, 4), dtype=np.int16))
+    assert all(value == 0.0 for value in stats["percentiles"].values())
+    assert all(high > low for low, high in stats["windows"].values())
+
+
+def test_percentile_from_histogram_interpolates_inside_bins():
+    counts = np.array([10, 0, 10])
+    edges = np.array([0.0, 1.0, 2.0, 3.0])
+    assert percentile_from_histogram(counts, edges, 25) == pytest.approx(0.5)
+    assert percentile_from_histogram(counts, edges, 75) == pytest.approx(2.5)
+    assert percentile_from_histogram(np.zeros(3), edges, 50) == 0.0
+
+
+def test_quantize_volume_maps_window_to_uint8(volume):
+    display = quantize_volume(volume, (100.0, 500.0))
+    assert display.dtype == np.uint8
+    assert display[volume <= 100].max() == 0
+    assert display[volume >= 500].min() == 255
+    np.testing.assert_array_equal(quantize_volume(volume, (100.0, 500.0), np.float16), volume.astype(np.float16))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from linked_series import LinkedSeries
+from slice_engine import VIEW_AXES, SliceEngine
+
+
+class ReadCounter:
+    """Lazy stand-in for a volume that counts the reads going through ``__getitem__``"""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return self.array[key]
+
+
+@pytest.fixture
+def volume():
+    return np.random.default_rng(0).random((10, 8, 6)).astype(np.float32)
+
+
+@pytest.mark.parametrize("view", list(VIEW_AXES))
+def test_identity_matches_reference_slices(volume, view):
+    affine = np.diag([2.0, 0.5, 0.5, 1.0])
+    series = LinkedSeries("same", volume, affine, affine, volume.shape)
+    engine = SliceEngine(volume)
+    for index in range(engine.slice_count(view)):
+        np.testing.assert_allclose(series.get(view, index), engine.get(view, index), atol=1e-6)
+    assert series.contains((0, 0, 0)) and not series.contains((10, 0, 0))
+
+
+def test_translated_series_is_shifted(volume):
+    reference_affine = np.eye(4)
+    affine = np.eye(4)
+    affine[:3, 3] = (1.0, 0.0, 0.0)  # this series starts one slice further along z
+    series = LinkedSeries("shifted", volume, affine, reference_affine, volume.shape)
+    np.testing.assert_allclose(series.map_point((3, 2, 1)), (2, 2, 1))
+    engine = SliceEngine(volume)
+    np.testing.assert_allclose(series.get("axial", 4), engine.get("axial", 3), atol=1e-6)
+
+
+def test_lazy_regions_are_kept_per_view():
+    # large enough that a region around one plane does not cover the planes of the other views
+    volume = np.random.default_rng(1).random((64, 64, 64)).astype(np.float32)
+    lazy = ReadCounter(volume)
+    affine = np.eye(4)
+    series = LinkedSeries("lazy", lazy, affine, affine, volume.shape)
+    engine = SliceEngine(volume)
+    for view in VIEW_AXES:
+        np.testing.assert_allclose(series.get(view, 10), engine.get(view, 10), atol=1e-6)
+    assert lazy.reads == len(VIEW_AXES)
+    # the next slices of every view fall inside the region that view already read
+    for view in VIEW_AXES:
+        np.testing.assert_allclose(series.get(view, 11), engine.get(view, 11), atol=1e-6)
+    assert lazy.reads == len(VIEW_AXES)
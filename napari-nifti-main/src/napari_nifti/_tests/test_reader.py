@@ -0,0 +1,186 @@
+import os
+import sys
+
+import nibabel as nib
+import numpy as np
+import pytest
+from medvol import MedVol
+
+from napari_nifti import napari_get_reader
+from napari_nifti._cache import VolumeCache
+from napari_nifti._lazy import LazyNiftiArray
+from napari_nifti._pyramid import build_pyramid
+from napari_nifti._reader import reader_function
+
+
+def write_nifti(path, shape=(12, 10, 8), dtype=np.int16, offset=0):
+    """Write a small NIfTI file whose voxel values encode their position; ``shape`` is in file (x, y, z) order."""
+    data = (np.arange(np.prod(shape)) + offset).reshape(shape).astype(dtype)
+    image = nib.Nifti1Image(data, np.diag([0.5, 0.75, 2.0, 1.0]))
+    image.set_data_dtype(dtype)
+    nib.save(image, str(path))
+    return str(path)
+
+
+@pytest.fixture
+def nii_file(tmp_path):
+    return write_nifti(tmp_path / "volume.nii")
+
+
+@pytest.fixture
+def gz_file(tmp_path):
+    return write_nifti(tmp_path / "volume.nii.gz")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VolumeCache(str(tmp_path / "cache"))
+
+
+def test_get_reader(nii_file):
+    assert callable(napari_get_reader(nii_file))
+    assert callable(napari_get_reader([nii_file]))
+    assert napari_get_reader("fake.file") is None
+
+
+def test_reader_matches_medvol(nii_file):
+    data, meta, layer_type = reader_function(nii_file)[0]
+    image = MedVol(nii_file)
+    assert layer_type == "image"
+    np.testing.assert_array_equal(data, image.array)
+    np.testing.assert_allclose(meta["affine"], image.affine)
+    np.testing.assert_allclose(meta["metadata"]["spacing"], image.spacing)
+
+
+def test_lazy_reader_returns_proxy(nii_file):
+    data, meta, _ = reader_function(nii_file, lazy=True)[0]
+    eager, eager_meta, _ = reader_function(nii_file)[0]
+    assert isinstance(data, LazyNiftiArray)
+    assert data.shape == eager.shape
+    assert data.dtype == eager.dtype
+    np.testing.assert_allclose(meta["affine"], eager_meta["affine"])
+
+
+@pytest.mark.parametrize("key", [
+    Ellipsis,
+    3,
+    -1,
+    (2, 4),
+    (slice(None), 5),
+    (Ellipsis, 1),
+    (1, Ellipsis),
+    (slice(1, 7, 2), slice(None, None, 3), slice(2, None)),
+    (slice(None, None, -1), 0),
+])
+def test_lazy_indexing(nii_file, key):
+    lazy = LazyNiftiArray(nii_file)
+    expected = MedVol(nii_file).array
+    np.testing.assert_array_equal(lazy[key], expected[key])
+
+
+def test_lazy_array_protocol(nii_file):
+    lazy = LazyNiftiArray(nii_file)
+    expected = MedVol(nii_file).array
+    np.testing.assert_array_equal(np.asarray(lazy), expected)
+    assert np.asarray(lazy, dtype=np.float32).dtype == np.float32
+    assert len(lazy) == expected.shape[0]
+    assert lazy.nbytes == expected.nbytes
+
+
+def test_lazy_big_endian_is_native(tmp_path):
+    path = write_nifti(tmp_path / "big_endian.nii", dtype=np.dtype(">i2"))
+    lazy = LazyNiftiArray(path)
+    assert lazy.dtype == np.dtype(np.int16)
+    assert lazy[2].dtype.isnative
+    np.testing.assert_array_equal(lazy[...], MedVol(path).array)
+
+
+def test_lazy_gz_falls_back_without_indexed_gzip(gz_file, monkeypatch):
+    # a None entry makes "import indexed_gzip" raise ImportError
+    monkeypatch.setitem(sys.modules, "indexed_gzip", None)
+    data = reader_function(gz_file, lazy=True)[0][0]
+    assert isinstance(data, np.ndarray)
+    np.testing.assert_array_equal(data, MedVol(gz_file).array)
+
+
+def test_cache_miss_then_hit(gz_file, cache):
+    expected = MedVol(gz_file).array
+    assert cache.load(gz_file) is None
+    first = reader_function(gz_file, lazy=True, cache=cache)[0][0]
+    np.testing.assert_array_equal(first, expected)
+    assert cache.load(gz_file) is not None
+    second = reader_function(gz_file, lazy=True, cache=cache)[0][0]
+    assert isinstance(second, np.memmap)
+    np.testing.assert_array_equal(second, expected)
+
+
+def test_cache_entry_evicted_before_reload(gz_file, cache, monkeypatch):
+    # another thread's evict() deletes the entry between store and the memory-mapped reload
+    monkeypatch.setattr(cache, "store", lambda path, array, meta: None)
+    data, meta, _ = reader_function(gz_file, lazy=True, cache=cache)[0]
+    np.testing.assert_array_equal(data, MedVol(gz_file).array)
+
+
+def test_cache_prunes_stale_versions(gz_file, cache):
+    reader_function(gz_file, cache=cache)
+    old_files = set(os.listdir(cache.cache_dir))
+    # rewrite the source: new content, size and modification time
+    write_nifti(gz_file, shape=(6, 5, 4), offset=7)
+    stat = os.stat(gz_file)
+    os.utime(gz_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    data = reader_function(gz_file, cache=cache)[0][0]
+    np.testing.assert_array_equal(data, MedVol(gz_file).array)
+    new_files = set(os.listdir(cache.cache_dir))
+    assert not old_files & new_files
+    assert len(new_files) == len(old_files)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    paths = [write_nifti(tmp_path / f"volume{i}.nii.gz", offset=i) for i in range(3)]
+    cache = VolumeCache(str(tmp_path / "cache"), max_bytes=None)
+    for i, path in enumerate(paths[:2]):
+        reader_function(path, cache=cache)
+        for suffix in (".npy", ".json"):
+            os.utime(cache.path_for(path, suffix), (i, i))  # volume0 is the least recently used
+    entry_size = sum(os.path.getsize(cache.path_for(paths[0], suffix)) for suffix in (".npy", ".json"))
+    cache.max_bytes = 2 * entry_size + 512  # room for two of the three entries
+    reader_function(paths[2], cache=cache)
+    assert cache.load(paths[0]) is None
+    assert cache.load(paths[1]) is not None
+    assert cache.load(paths[2]) is not None
+
+
+def test_build_pyramid_level_shapes():
+    volume = np.random.default_rng(0).random((64, 40, 36)).astype(np.float32)
+    pyramid = build_pyramid(volume, levels=3)
+    # stops before a level would be smaller than MIN_LEVEL_SIZE
+    assert [level.shape for level in pyramid] == [(64, 40, 36), (32, 20, 18)]
+    np.testing.assert_allclose(pyramid[1][0, 0, 0], volume[:2, :2, :2].mean(), rtol=1e-6)
+
+
+def test_multiscale_reader_caches_levels(tmp_path, cache):
+    path = write_nifti(tmp_path / "large.nii.gz", shape=(64, 64, 64))
+    levels, meta, _ = reader_function(path, cache=cache, multiscale=True)[0]
+    assert meta["multiscale"] is True
+    assert [level.shape for level in levels] == [(64, 64, 64), (32, 32, 32), (16, 16, 16)]
+    assert cache.load_array(path, "_level1.npy") is not None
+    cached_levels = reader_function(path, cache=cache, multiscale=True)[0][0]
+    for level, cached in zip(levels, cached_levels):
+        np.testing.assert_array_equal(level, cached)
+
+
+def test_workers_preserve_order(tmp_path):
+    paths = [write_nifti(tmp_path / f"volume{i}.nii", offset=1000 * i) for i in range(5)]
+    layers = reader_function(paths, workers=4)
+    assert len(layers) == len(paths)
+    for path, (data, _, _) in zip(paths, layers):
+        np.testing.assert_array_equal(data, MedVol(path).array)
+
+
+def test_chunked_reader(nii_file):
+    pytest.importorskip("dask.array")
+    data = reader_function(nii_file, lazy=True, chunks=(4, 4, 4))[0][0]
+    expected = MedVol(nii_file).array
+    assert data.chunksize == (4, 4, 4)
+    np.testing.assert_array_equal(data[3].compute(), expected[3])
+    np.testing.assert_array_equal(np.asarray(data), expected)
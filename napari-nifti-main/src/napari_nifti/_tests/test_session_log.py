@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+napari = pytest.importorskip("napari")
+from napari.components import ViewerModel  # noqa: E402
+
+from session_log import PROJECT_ROOT, SessionLogger, SessionReplay, portable_path, read_session, resolve_path  # noqa: E402
+
+
+class FakeUI:
+    """Display state outside the layers, as kept by ViewerUI"""
+
+    def __init__(self, state=None):
+        self.state = state
+        self.applied = []
+
+    def session_state(self):
+        return dict(self.state)
+
+    def apply_session_state(self, state):
+        self.applied.append(state)
+
+
+def make_viewer():
+    viewer = ViewerModel()
+    viewer.add_image(np.zeros((5, 6, 7), dtype=np.float32), name="Volume")
+    return viewer
+
+
+def test_portable_paths_round_trip():
+    inside = os.path.join(PROJECT_ROOT, "data", "volume.nii.gz")
+    assert portable_path(inside) == os.path.join("data", "volume.nii.gz")
+    assert resolve_path(portable_path(inside)) == inside
+    assert portable_path("/elsewhere/volume.nii.gz") == "/elsewhere/volume.nii.gz"
+
+
+def test_session_log_round_trip(tmp_path):
+    viewer = make_viewer()
+    shapes = viewer.add_shapes(name="Rectangles", ndim=2, scale=(2.0, 3.0), translate=(10.0, 20.0),
+                               edge_width=4, edge_color="red", face_color=[0, 0, 0, 0])
+    ui = FakeUI({"slab_mode": None, "slab_thickness_mm": 10.0, "cpr_points": None, "cpr_offset_mm": 0.0,
+                 "linked_series": []})
+    logger = SessionLogger(viewer, source=os.path.join(PROJECT_ROOT, "data", "volume.nii.gz"),
+                           ui_state=ui.session_state)
+    log_path = str(tmp_path / "session.jsonl")
+    logger.start(log_path)
+    viewer.dims.current_step = (3, 0, 0)
+    shapes.add(np.array([[1.0, 1.0], [4.0, 5.0]]), shape_type="rectangle")
+    logger.log("ui", **dict(ui.state, slab_mode="max"))
+    logger.stop()
+
+    records = read_session(log_path)
+    assert records[0]["source"] == os.path.join("data", "volume.nii.gz")
+    assert records[0]["ui"]["slab_thickness_mm"] == 10.0
+    assert [record["e"] for record in records][-1] == "stop"
+
+    replayed = make_viewer()
+    replay_ui = FakeUI()
+    replay = SessionReplay(replayed, records, ui=replay_ui)
+    replay.seek(replay.duration)
+    assert replayed.dims.current_step[0] == 3
+    layer = replayed.layers["Rectangles"]
+    np.testing.assert_allclose(layer.scale, (2.0, 3.0))
+    np.testing.assert_allclose(layer.translate, (10.0, 20.0))
+    assert len(layer.data) == 1 and list(layer.shape_type) == ["rectangle"]
+    np.testing.assert_allclose(layer.data[0], shapes.data[0], atol=1e-3)
+    assert layer.edge_width[0] == 4
+    np.testing.assert_allclose(layer.edge_color[0], shapes.edge_color[0], atol=1e-3)
+    assert [state["slab_mode"] for state in replay_ui.applied] == [None, "max"]
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from napari_nifti._cache import VolumeCache
+from slice_engine import SLAB_MODES, VIEW_AXES, SlabProjector, SliceEngine
+
+
+def display_slice(volume, view, index):
+    """Slice as the viewer displays it: ``np.fliplr(np.rot90(s, k=2))``"""
+    return np.fliplr(np.rot90(np.take(volume, index, axis=VIEW_AXES[view]), k=2))
+
+
+@pytest.fixture
+def volume():
+    return np.random.default_rng(0).integers(0, 1000, size=(9, 7, 5)).astype(np.int16)
+
+
+@pytest.fixture
+def memmap_volume(tmp_path, volume):
+    path = str(tmp_path / "volume.npy")
+    np.save(path, volume)
+    return np.load(path, mmap_mode="r"), path
+
+
+@pytest.mark.parametrize("view", list(VIEW_AXES))
+def test_in_memory_orientation(volume, view):
+    engine = SliceEngine(volume, views=tuple(VIEW_AXES))
+    assert engine.stacks == {}
+    for index in range(engine.slice_count(view)):
+        np.testing.assert_array_equal(engine.get(view, index), display_slice(volume, view, index))
+
+
+@pytest.mark.parametrize("view", list(VIEW_AXES))
+def test_memmap_orientation_without_cache(memmap_volume, volume, view):
+    data, _ = memmap_volume
+    engine = SliceEngine(data, views=tuple(VIEW_AXES))
+    try:
+        for index in range(engine.slice_count(view)):
+            np.testing.assert_array_equal(engine.get(view, index), display_slice(volume, view, index))
+    finally:
+        engine.close()
+
+
+def test_cached_stacks_match_display_orientation(tmp_path, memmap_volume, volume):
+    data, path = memmap_volume
+    cache = VolumeCache(str(tmp_path / "cache"))
+    engine = SliceEngine(data, views=tuple(VIEW_AXES), cache=cache, path=path)
+    engine.builder.join()
+    assert set(engine.stacks) == set(VIEW_AXES)
+    for view in VIEW_AXES:
+        assert engine.stacks[view].shape == engine.stack_shape(view)
+        for index in range(engine.slice_count(view)):
+            np.testing.assert_array_equal(engine.get(view, index), display_slice(volume, view, index))
+
+    # a second engine memory-maps the stacks written by the first
+    reused = SliceEngine(data, views=tuple(VIEW_AXES), cache=cache, path=path)
+    assert reused.builder is None and reused.slice_cache is None
+    np.testing.assert_array_equal(reused.get("sagittal", 2), display_slice(volume, "sagittal", 2))
+
+
+def brute_force_slab(volume, view, start, stop, mode):
+    slices = np.stack([display_slice(volume, view, index) for index in range(start, stop)])
+    if mode == "mean":
+        return slices.mean(axis=0)
+    return slices.max(axis=0) if mode == "max" else slices.min(axis=0)
+
+
+@pytest.mark.parametrize("mode", SLAB_MODES)
+@pytest.mark.parametrize("thickness", [1, 2, 3, 4, 9])
+def test_slab_projection_matches_brute_force(volume, mode, thickness):
+    engine = SliceEngine(volume)
+    projector = SlabProjector(engine, "axial", thickness, mode)
+    # forwards, backwards and jumping, so block reuse and the sliding sum are exercised
+    order = list(range(9)) + list(range(8, -1, -1)) + [0, 8, 3, 6, 1]
+    for index in order:
+        start, stop = projector.slab_range(index)
+        assert stop - start == thickness
+        assert 0 <= start and stop <= 9
+        np.testing.assert_allclose(projector.get(index), brute_force_slab(volume, "axial", start, stop, mode),
+                                   rtol=1e-6)
+
+
+def test_slab_thickness_is_clipped(volume):
+    projector = SlabProjector(SliceEngine(volume), "sagittal", 100, "max")
+    assert projector.thickness == 5
+    assert projector.slab_range(4) == (0, 5)
+    with pytest.raises(ValueError):
+        SlabProjector(SliceEngine(volume), "sagittal", 3, "median")
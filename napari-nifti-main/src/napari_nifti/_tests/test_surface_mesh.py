@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from napari_nifti._cache import VolumeCache
+from surface_mesh import decimate, load_surface
+
+
+def sphere(size=40, radius=15.0):
+    z, y, x = np.mgrid[:size, :size, :size]
+    centre = (size - 1) / 2
+    return (radius - np.sqrt((z - centre) ** 2 + (y - centre) ** 2 + (x - centre) ** 2)).astype(np.float32)
+
+
+@pytest.fixture
+def mesh():
+    from skimage.measure import marching_cubes
+
+    vertices, faces, _, _ = marching_cubes(sphere(), level=0.0)
+    return vertices, faces
+
+
+def test_decimate_keeps_small_meshes(mesh):
+    vertices, faces = mesh
+    reduced_vertices, reduced_faces = decimate(vertices, faces, max_faces=len(faces))
+    np.testing.assert_allclose(reduced_vertices, vertices)
+    np.testing.assert_array_equal(reduced_faces, faces)
+
+
+def test_decimate_reduces_to_valid_mesh(mesh):
+    vertices, faces = mesh
+    max_faces = len(faces) // 8
+    reduced_vertices, reduced_faces = decimate(vertices, faces, max_faces=max_faces)
+    assert 0 < len(reduced_faces) <= max_faces
+    assert reduced_vertices.dtype == np.float32 and reduced_faces.dtype == np.int32
+    assert reduced_faces.min() >= 0 and reduced_faces.max() < len(reduced_vertices)
+    # no collapsed or repeated triangles
+    assert np.all(np.diff(np.sort(reduced_faces, axis=1), axis=1) > 0)
+    assert len(np.unique(np.sort(reduced_faces, axis=1), axis=0)) == len(reduced_faces)
+    # clustered vertices stay on the sphere within a few voxels
+    radii = np.linalg.norm(reduced_vertices - (40 - 1) / 2, axis=1)
+    assert np.all(np.abs(radii - 15.0) < 4.0)
+
+
+def test_surface_cache_is_keyed_by_dtype_and_window(tmp_path):
+    path = str(tmp_path / "volume.npy")
+    volume = sphere() + 15.0  # 30 at the centre, 15 on the sphere
+    np.save(path, volume)
+    cache = VolumeCache(str(tmp_path / "cache"))
+    original = load_surface(volume, 15.0, path, cache)
+    quantized = np.clip(volume * 255.0 / 30.0, 0, 255).astype(np.uint8)
+    display = load_surface(quantized, 15.0, path, cache, window=(0.0, 30.0))
+    # same threshold number, different units: a different iso-surface, not the cached one
+    assert len(display[0]) != len(original[0]) or not np.allclose(display[0], original[0])
+    cached = load_surface(volume, 15.0, path, cache)
+    np.testing.assert_array_equal(cached[0], original[0])
+    np.testing.assert_array_equal(cached[1], original[1])
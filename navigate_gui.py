@@ -1,14 +1,42 @@
 import os
 import sys
+import queue
 import subprocess
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from utils.catalog import NiftiCatalog, CatalogWorker, COLUMNS
+from utils.scanner import DirectoryScanner
+from utils.viewer_ipc import open_in_viewer
+
+SCAN_BATCHES_PER_TICK = 5  # scanner batches inserted per Tk tick, keeps the UI responsive
+
+# header columns shown next to the file tree: (column id, heading, width)
+METADATA_COLUMNS = [
+    ('size', 'Size', 80),
+    ('shape', 'Shape', 100),
+    ('voxel_size', 'Voxel (mm)', 100),
+    ('orientation', 'Orient.', 60),
+    ('dtype', 'Dtype', 70),
+    ('sequence', 'Sequence', 160),
+]
 
 class NIFTINavigator:
     def __init__(self, root):
         self.root = root
         self.root.title("NIfTI File Navigator")
-        self.root.geometry("800x600")
+        self.root.geometry("1200x600")
+
+        # Header metadata catalog, filled in the background
+        self.catalog = NiftiCatalog()
+        self.catalog_queue = queue.Queue()
+        self.catalog_worker = None
+        self.catalog_pending = []
+        self.file_nodes = {}  # {full_path: tree item id}
+        self.dir_nodes = {}  # {directory: tree item id}
+        self.sort_reverse = {}
+        self.scanner = None
+        self.open_queue = queue.Queue()  # (file_name, viewer reply) from the IPC threads
         
         # Initialize UI components
         self.create_widgets()
@@ -20,9 +48,14 @@ class NIFTINavigator:
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # File list treeview
-        self.tree = ttk.Treeview(list_frame, columns=('fullpath', 'size'), show='tree')
-        self.tree.heading('#0', text='NIfTI File Structure')
+        columns = ('fullpath',) + tuple(col for col, _, _ in METADATA_COLUMNS)
+        self.tree = ttk.Treeview(list_frame, columns=columns, show='tree headings',
+                                 displaycolumns=columns[1:])
+        self.tree.heading('#0', text='NIfTI File Structure', command=lambda: self.sort_by('#0'))
         self.tree.column('#0', width=400)
+        for col, heading, width in METADATA_COLUMNS:
+            self.tree.heading(col, text=heading, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=width, anchor=tk.W)
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         # Scrollbar
@@ -46,46 +79,153 @@ class NIFTINavigator:
         self.tree.bind('<Double-1>', self.run_selected)
     
     def scan_directory(self, path):
-        """Scan for NIfTI files in the specified directory"""
+        """Scan for NIfTI files in the specified directory (in the background) and watch it for changes"""
+        if self.scanner is not None:
+            self.scanner.stop()
         self.tree.delete(*self.tree.get_children())
-        self.file_list = []
-        
-        for root_dir, _, files in os.walk(path):
-            for filename in files:
-                if filename.lower().endswith('.nii.gz'):
-                    full_path = os.path.join(root_dir, filename)
-                    parent = os.path.dirname(full_path).replace(path, '').lstrip(os.sep)
-                    parent_node = self._get_parent_node(parent) or ''
-                    self.tree.insert(
-                        parent_node, 'end', 
-                        values=(full_path, f"{os.path.getsize(full_path)//1024} KB"),
-                        text=filename,
-                        tags=('nii_file',)
-                    )
-                    self.file_list.append(full_path)                       
+        self.root_path = os.path.abspath(path)
+        self.file_nodes = {}
+        self.dir_nodes = {self.root_path: ''}
+        self.catalog_pending = []
+        self.status.config(text=f"Scanning {self.root_path}...")
+        self.scan_queue = queue.Queue()
+        self.scanner = DirectoryScanner(self.root_path, self.scan_queue, catalog=self.catalog)
+        self.scanner.start()
+        self.root.after(50, self._poll_scanner)
+
+    def _poll_scanner(self):
+        """Insert streamed scan results into the tree on the Tk thread, a few batches per tick"""
+        for _ in range(SCAN_BATCHES_PER_TICK):
+            try:
+                events = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            removed = []
+            for kind, path, size, info in events:
+                if kind == 'add':
+                    self._add_file(path, size, info)
+                elif kind == 'update':
+                    self._update_file(path, size, info)
+                elif kind == 'remove':
+                    removed.append(path)
+                elif kind == 'done':
+                    self.status.config(text=f"Found {len(self.file_nodes)} files")
+            self._remove_paths(removed)
+            self._start_catalog_worker()
+        if self.scanner is not None and (self.scanner.is_alive() or not self.scan_queue.empty()):
+            self.root.after(50, self._poll_scanner)
+
+    def _add_file(self, full_path, size, info=None):
+        """Insert one file below its directory node (``info`` is looked up by the scanner thread)"""
+        if full_path in self.file_nodes:
+            return
+        parent_node = self._get_parent_node(os.path.dirname(full_path))
+        if info is None:
+            self.catalog_pending.append(full_path)
+            info = {}
+        self.file_nodes[full_path] = self.tree.insert(
+            parent_node, 'end', 
+            values=(full_path, f"{size//1024} KB") + tuple(info.get(col, '') for col in COLUMNS),
+            text=os.path.basename(full_path),
+            tags=('nii_file',)
+        )
+
+    def _update_file(self, full_path, size, info=None):
+        """Refresh the size and header columns of a file that was written after it was listed"""
+        node = self.file_nodes.get(full_path)
+        if node is None or not self.tree.exists(node):
+            self._add_file(full_path, size, info)
+            return
+        self.tree.set(node, 'size', f"{size//1024} KB")
+        if info is None:
+            # header changed or not read yet, the catalog worker fills the columns in
+            self.catalog_pending.append(full_path)
+            info = {}
+        for col in COLUMNS:
+            self.tree.set(node, col, info.get(col, ''))
+
+    def _remove_paths(self, paths):
+        """Remove deleted files and directories (with everything below them) from the tree"""
+        nodes = [self.file_nodes.pop(path) for path in paths if path in self.file_nodes]
+        directories = {path for path in paths if self.dir_nodes.get(path)}
+        if directories:
+            # one pass over the index for the whole batch
+            prefixes = tuple(directory + os.sep for directory in directories)
+            nodes += [self.dir_nodes[directory] for directory in directories]
+            for known in [p for p in self.file_nodes if p.startswith(prefixes)]:
+                del self.file_nodes[known]
+            for known in [d for d in self.dir_nodes if d in directories or d.startswith(prefixes)]:
+                del self.dir_nodes[known]
+        for node in nodes:
+            if self.tree.exists(node):
+                self.tree.delete(node)
+
+    def _start_catalog_worker(self):
+        """Read headers of files missing from the catalog in a background thread"""
+        if not self.catalog_pending or (self.catalog_worker is not None and self.catalog_worker.is_alive()):
+            return
+        missing, self.catalog_pending = self.catalog_pending, []
+        self.status.config(text=f"Reading headers of {len(missing)} files...")
+        self.catalog_worker = CatalogWorker(self.catalog, missing, self.catalog_queue)
+        self.catalog_worker.start()
+        self.root.after(100, self._poll_catalog)
+
+    def _poll_catalog(self):
+        """Apply catalog results on the Tk thread"""
+        while True:
+            try:
+                path, info = self.catalog_queue.get_nowait()
+            except queue.Empty:
+                break
+            node = self.file_nodes.get(path)
+            if node and self.tree.exists(node):
+                for col in COLUMNS:
+                    self.tree.set(node, col, info[col])
+        if self.catalog_worker is not None and self.catalog_worker.is_alive():
+            self.root.after(100, self._poll_catalog)
+        elif self.catalog_pending:
+            self._start_catalog_worker()
+        else:
+            self.status.config(text="Ready")
+
+    def sort_by(self, col):
+        """Sort files (within each directory) by a column, toggling the direction"""
+        reverse = self.sort_reverse[col] = not self.sort_reverse.get(col, True)
+
+        def sort_key(item):
+            value = self.tree.item(item, 'text') if col == '#0' else self.tree.set(item, col)
+            if col == 'size':
+                return (0, int(value.split()[0])) if value else (1, 0)
+            if col in ('shape', 'voxel_size'):
+                # "160x256x256" and "0.80x0.80x1.00" compare numerically, axis by axis
+                try:
+                    return (0, tuple(float(part) for part in value.split('x'))) if value else (1, ())
+                except ValueError:
+                    return (1, ())
+            return (0, value.lower()) if value else (1, '')
+
+        def sort_children(parent):
+            children = list(self.tree.get_children(parent))
+            children.sort(key=sort_key, reverse=reverse)
+            for index, child in enumerate(children):
+                self.tree.move(child, parent, index)
+                sort_children(child)
+        sort_children('')
     
-    def _get_parent_node(self, path):
-        """Build tree directory structure"""
-        if not path:
-            return ''
-            
-        parts = path.split(os.sep)
-        parent_node = ''
-        for part in parts:
-            children = self.tree.get_children(parent_node)
-            found = False
-            for child in children:
-                if self.tree.item(child, 'text') == part:
-                    parent_node = child
-                    found = True
-                    break
-            if not found:
-                parent_node = self.tree.insert(
-                    parent_node, 'end', 
-                    text=part,
-                    tags=('directory',)
-                )
-        return parent_node
+    def _get_parent_node(self, directory):
+        """Return the tree node of a directory, creating missing ancestors (indexed, no child search)"""
+        node = self.dir_nodes.get(directory)
+        if node is not None:
+            return node
+        if os.path.dirname(directory) == directory:
+            return ''  # outside the scanned root
+        parent_node = self._get_parent_node(os.path.dirname(directory))
+        node = self.dir_nodes[directory] = self.tree.insert(
+            parent_node, 'end', 
+            text=os.path.basename(directory),
+            tags=('directory',)
+        )
+        return node
     
     def run_selected(self, event=None):
         """Run selected file"""
@@ -103,6 +243,23 @@ class NIFTINavigator:
         # file_name = os.path.basename(file_name)
         self.status.config(text=f"Opening: {os.path.basename(file_path)}...")
         print(f'==========={file_name}===========')
+        # reuse an already running viewer window if there is one; asking may block, so not on the Tk thread
+        threading.Thread(target=lambda: self.open_queue.put((file_name, open_in_viewer(file_name))),
+                         daemon=True).start()
+        self.root.after(50, self._poll_open)
+
+    def _poll_open(self):
+        """Handle the running viewer's answer on the Tk thread, start a viewer only if none is running"""
+        try:
+            file_name, reply = self.open_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self._poll_open)
+            return
+        if reply is not None:
+            if not reply.get('ok'):
+                messagebox.showerror("Error", f"The viewer could not open the file:\n{reply.get('error', '')}")
+            self.status.config(text="Ready")
+            return
         try:
             subprocess.Popen([
             sys.executable,
@@ -115,8 +272,8 @@ class NIFTINavigator:
             self.status.config(text="Ready")
     
     def refresh_list(self):
-        """Refresh file list"""
-        self.scan_directory(os.path.dirname(__file__))
+        """Refresh file list (changes are picked up automatically, this forces a full rescan)"""
+        self.scan_directory(self.root_path)
     
     def open_directory(self):
         """Select another directory"""
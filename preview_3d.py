@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import napari
+from napari.qt.threading import thread_worker
+
+from rotating_mip import load_rotating_mip
+from surface_mesh import load_surface
+
+PREVIEW_FACTORS = (4, 2, 1)  # downsampling factors rendered in turn, coarse to full resolution
+SURFACE_COLORMAPS = ['cyan', 'bop orange', 'green', 'magenta']
+
+
+@thread_worker
+def _refine(volume, factors, cache=None, filepath=None):
+    """Yield (factor, level, offset) from the coarsest to the full-resolution volume.
+
+    ``offset`` is the position, in voxels of ``volume``, of the first voxel of
+    ``level`` along each axis.
+    """
+    for factor in factors:
+        level = None
+        if factor > 1 and cache is not None and filepath:
+            # pyramid levels written by the reader (multiscale=True) are block means of 2**n voxels
+            level = cache.load_array(filepath, f"_level{int(np.log2(factor))}.npy")
+            if level is not None and (level.dtype != volume.dtype or level.shape != tuple(s // factor for s in volume.shape)):
+                level = None  # built from the original while the viewer shows a display copy
+            offset = (factor - 1) / 2
+        if level is None:
+            # strided subsampling only reads every factor-th slice of a lazy volume
+            level = np.asarray(volume[factor // 2::factor, factor // 2::factor, factor // 2::factor])
+            offset = factor // 2
+        yield factor, level, offset
+
+
+@thread_worker
+def _extract_surfaces(volume, levels, cache=None, filepath=None, window=None):
+    """Yield (name, (vertices, faces)) for each iso level, from the mesh cache when possible"""
+    for name, threshold in levels.items():
+        try:
+            yield name, load_surface(volume, threshold, filepath, cache, window=window)
+        except (ValueError, RuntimeError) as e:
+            print(f"Could not extract {name} surface: {str(e)}")
+
+
+@thread_worker
+def _rotating_mip(volume, cache=None, filepath=None):
+    return load_rotating_mip(volume, filepath, cache)
+
+
+class Preview3D:
+    """In-process 3D view of the volume a ViewerUI already has loaded.
+
+    A second napari window (sharing the Qt application and the volume, so
+    nothing is re-read or re-decoded) opens immediately. A background worker
+    then yields the volume at 4x, 2x and full resolution and the layer is
+    swapped for each, so a coarse MIP is visible within a fraction of a second
+    and refines while the user is already rotating it.
+    """
+
+    def __init__(self, volume, filepath, spacing=None, contrast_limits=None, cache=None, surface_levels=None,
+                 window=None):
+        self.volume = volume
+        self.window = window  # the window ``volume`` was quantized with, None for original values
+        self.filepath = filepath
+        self.cache = cache
+        self.spacing = np.ones(3) if spacing is None else np.asarray(spacing, dtype=float)
+        self.contrast_limits = contrast_limits
+        self.surface_levels = surface_levels or {}
+        self.surface_worker = None
+        self.mip_worker = None
+        self.layer = None
+        self.viewer = napari.Viewer(title="3D file")
+        self.viewer.window._qt_window.resize(800, 600)
+        self.viewer.bind_key('S', lambda viewer: self.show_surfaces())
+        self.viewer.bind_key('M', lambda viewer: self.show_rotating_mip())
+        print(f"File: {os.path.basename(filepath)}")
+        print(f"Data shape: {volume.shape}")
+        self.worker = _refine(volume, PREVIEW_FACTORS, cache, filepath)
+        self.worker.yielded.connect(self._show_level)
+        self.worker.start()
+
+    def _show_level(self, result):
+        factor, level, offset = result
+        # scale and shift each level so every resolution covers the same physical extent
+        scale = self.spacing * factor
+        translate = self.spacing * offset
+        if self.layer is None:
+            self.layer = self.viewer.add_image(
+                level,
+                rendering='mip',  # Maximum intensity projection
+                name='3D render image',
+                blending='additive',
+                opacity=0.7,
+                contrast_limits=self.contrast_limits,
+                scale=scale,
+                translate=translate,
+            )
+            self.viewer.dims.ndisplay = 3
+            self.viewer.reset_view()
+        else:
+            self.layer.data = level
+            self.layer.scale = scale
+            self.layer.translate = translate
+
+    def show_surfaces(self):
+        """Extract (or load cached) iso-surface meshes in the background and add them as surface layers"""
+        if self.surface_worker is not None or not self.surface_levels:
+            return
+        print("Extracting surfaces...")
+        self.surface_worker = _extract_surfaces(self.volume, self.surface_levels, self.cache, self.filepath, self.window)
+        self.surface_worker.yielded.connect(self._add_surface)
+        self.surface_worker.start()
+
+    def _add_surface(self, result):
+        name, (vertices, faces) = result
+        colormap = SURFACE_COLORMAPS[len(self.viewer.layers) % len(SURFACE_COLORMAPS)]
+        self.viewer.add_surface(
+            (vertices, faces, np.ones(len(vertices), dtype=np.float32)),
+            name=f'{name} surface',
+            colormap=colormap,
+            opacity=0.6,
+            scale=self.spacing,
+        )
+        if self.layer is not None:
+            # the mesh replaces the ray-marched volume as the main 3D content
+            self.layer.visible = False
+
+    def show_rotating_mip(self):
+        """Switch to precomputed 2D MIPs around the cranio-caudal axis, for machines without a usable GPU"""
+        if self.mip_worker is not None:
+            return
+        print("Computing rotating MIP...")
+        self.mip_worker = _rotating_mip(self.volume, self.cache, self.filepath)
+        self.mip_worker.returned.connect(self._add_rotating_mip)
+        self.mip_worker.start()
+
+    def _add_rotating_mip(self, frames):
+        for layer in self.viewer.layers:
+            layer.visible = False
+        self.viewer.add_image(
+            frames,
+            name='Rotating MIP',
+            contrast_limits=self.contrast_limits,
+            scale=(1, self.spacing[0], self.spacing[2]),
+        )
+        # the first dims slider now scrubs the rotation angle
+        self.viewer.dims.ndisplay = 2
+        self.viewer.dims.set_current_step(0, 0)
+        self.viewer.reset_view()
+
+    def is_open(self):
+        try:
+            return self.viewer.window._qt_window.isVisible()
+        except RuntimeError:  # the Qt window has been deleted
+            return False
+
+    def raise_window(self):
+        self.viewer.window._qt_window.raise_()
+        self.viewer.window._qt_window.activateWindow()
+
+    def close(self):
+        self.worker.quit()
+        for worker in (self.surface_worker, self.mip_worker):
+            if worker is not None:
+                worker.quit()
+        if self.is_open():
+            self.viewer.close()
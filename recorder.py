@@ -6,17 +6,40 @@ import numpy as np
 from imageio import get_writer
 from mss import mss
 import queue
+import zlib
 import sounddevice as sd
 from scipy.io.wavfile import write as write_wav
 import cv2
 from PIL import Image, ImageDraw, ImageFont
+from qtpy.QtCore import QTimer
+from utils.ffmpeg_writer import FFmpegPipeWriter, ENCODER_PRESETS
+from session_log import SessionLogger
+
+FRAME_QUEUE_SIZE = 30  # frames buffered between capture and encoder (2 s at 15 fps)
+# when the encoder falls behind and the queue is full:
+# 'oldest' drops the oldest queued frame (the video stays close to live), 'newest' drops the new frame
+DROP_POLICY = 'oldest'
 
 class ScreenRecorder:
-    def __init__(self, FONT_PATH, FONT_SIZE, RECORD_PATH, FPS, MAX_TEXT_DURATION):
+    def __init__(self, FONT_PATH, FONT_SIZE, RECORD_PATH, FPS, MAX_TEXT_DURATION, ENCODER_PRESET='live',
+                 VARIABLE_FRAME_RATE=False, CAPTURE_SOURCE='screen', SESSION_LOG=False):
         self.is_recording = False
         self.writer = None
         self.monitor = None
         self.capture_thread = None
+        self.encoder_thread = None
+        # (pts, BGRA frame), or (pts, None) when the screen has not changed; None ends the stream
+        self.frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.dropped_frames = 0
+        self.duplicated_frames = 0
+        self.unchanged_frames = 0  # grabs skipped because the screen had not changed
+        self.last_signature = None  # (shape, checksum) of the last queued frame
+        self.pixel_format = 'bgra'  # channel order of queued frames: 'bgra' (mss) or 'rgba' (OpenGL)
+        self.scene_canvas = None  # vispy canvas the 'canvas' source reads from
+        self.canvas_timer = None  # queues the unchanged markers while the canvas does not redraw
+        self.next_canvas_grab = 0.0
+        self.canvas_grab_pending = False
+        self.session_logger = None
         self.audio_thread = None
         self.audio_frames = []
         self.fs = 44100  # sampling rate for the audio
@@ -33,10 +56,23 @@ class ScreenRecorder:
         self.image_name = None
         self.video_path = None
         self.log_path = None
+        self.source_path = None  # file shown in the viewer, written to the session log for replay
+        self.ui_state = None  # returns the viewer's display state outside its layers (ViewerUI.session_state)
 
         self.RECORD_PATH = RECORD_PATH
         self.FPS = FPS
         self.MAX_TEXT_DURATION = MAX_TEXT_DURATION
+        # 'live', 'archival' or 'proxy' (see utils.ffmpeg_writer); None uses the imageio writer
+        self.ENCODER_PRESET = ENCODER_PRESET
+        # keep only changed frames, each shown from its capture time until the next one, instead of
+        # repeating frames at a constant rate; needs an ENCODER_PRESET
+        self.VARIABLE_FRAME_RATE = VARIABLE_FRAME_RATE
+        # 'screen' grabs the napari window from the screen (docks and panels included);
+        # 'canvas' reads the rendered scene from the OpenGL canvas after each redraw, at its own resolution
+        # None records no video at all (only the text log and, with SESSION_LOG, the session log)
+        self.CAPTURE_SOURCE = CAPTURE_SOURCE
+        # also write the viewer state changes to <video>_session.jsonl, replayable with replay_session.py
+        self.SESSION_LOG = SESSION_LOG
     
     def add_annotation(self, text):
         """Add text annotation"""
@@ -58,6 +94,8 @@ class ScreenRecorder:
                 )
                 with open(self.log_path, "a") as f:
                     f.write(log_entry)
+                if self.session_logger is not None:
+                    self.session_logger.log('annotation', text=text)
         except Exception as e:
             print(f"Annotation error: {str(e)}")
         
@@ -97,25 +135,49 @@ class ScreenRecorder:
         # generate the file name
         timestamp_str = self.start_time.strftime("%Y%m%d_%H%M_%S")
         base_name = f"{timestamp_str}_{self.image_name}"
-        self.video_path = os.path.join(self.RECORD_PATH, f"{base_name}.mp4")
+        extension = ENCODER_PRESETS[self.ENCODER_PRESET]['extension'] if self.ENCODER_PRESET else '.mp4'
+        self.video_path = os.path.join(self.RECORD_PATH, f"{base_name}{extension}")
         self.log_path = os.path.join(self.RECORD_PATH, f"{base_name}_log.txt")
 
         # write the start time to the log
         timestamp_start = self.start_time.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
         with open(self.log_path, "a") as f:
             f.write(f"\n[Video Recording Started] {timestamp_start}\n")
+
+        if self.SESSION_LOG:
+            self.session_logger = SessionLogger(viewer, source=self.source_path, ui_state=self.ui_state)
+            self.session_logger.start(os.path.join(self.RECORD_PATH, f"{base_name}_session.jsonl"))
+        self.writer = None
+        if self.CAPTURE_SOURCE is None:
+            self.capture_thread = None
+            self.encoder_thread = None
+            return
         
-        win = viewer.window._qt_window
-        time.sleep(0.5)  # add delay
-        self._update_region(win)
-        win.moveEvent = lambda event: self._update_region(win)
+        if self.CAPTURE_SOURCE != 'canvas':
+            win = viewer.window._qt_window
+            time.sleep(0.5)  # add delay
+            self._update_region(win)
+            win.moveEvent = lambda event: self._update_region(win)
         
-        # intialize the video writer
-        self.writer = get_writer(self.video_path, format='FFMPEG', fps=self.FPS)
+        # the video writer is opened by the encoder thread once the frame size is known
+        self.writer = None
         
-        # start the screen capture thread
-        self.capture_thread = threading.Thread(target=self._capture_loop)
-        self.capture_thread.start()
+        # capture and encoding run in separate threads, so a slow encoder never delays a capture
+        self.frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.dropped_frames = 0
+        self.duplicated_frames = 0
+        self.unchanged_frames = 0
+        self.last_signature = None
+        self.capture_origin = time.perf_counter()
+        self.encoder_thread = threading.Thread(target=self._encode_loop)
+        self.encoder_thread.start()
+        if self.CAPTURE_SOURCE == 'canvas':
+            self.capture_thread = None
+            self._start_canvas_capture(viewer)
+        else:
+            self.pixel_format = 'bgra'
+            self.capture_thread = threading.Thread(target=self._capture_loop)
+            self.capture_thread.start()
 
         # # initialize the audio recording
         # self.audio_filename = os.path.join(self.RECORD_PATH, f"{base_name}_temp.wav")
@@ -141,43 +203,205 @@ class ScreenRecorder:
 
     def _update_region(self, window):
         # update the napari window coordinates
-        # geo = window.geometry()
-        geo = window.frameGeometry() 
+        # Qt geometry is in device-independent pixels, mss expects physical screen pixels
+        geo = window.frameGeometry()
+        ratio = window.devicePixelRatioF()
         self.monitor = {
-            "left": geo.x(),
-            "top": geo.y(),
-            # "width": geo.width(),
-            # "height": geo.height()
-            "width": geo.width()+1300,
-            "height": geo.height()+900
+            "left": int(round(geo.x() * ratio)),
+            "top": int(round(geo.y() * ratio)),
+            "width": int(round(geo.width() * ratio)),
+            "height": int(round(geo.height() * ratio))
         }
 
+    def _start_canvas_capture(self, viewer):
+        """Read frames from the napari canvas after it redraws, instead of grabbing the screen"""
+        canvas = viewer.window.qt_viewer.canvas
+        # newer napari wraps the vispy SceneCanvas instead of subclassing it
+        self.scene_canvas = getattr(canvas, '_scene_canvas', canvas)
+        self.pixel_format = 'rgba'
+        self.next_canvas_grab = 0.0
+        self.canvas_grab_pending = False
+        # after napari's own draw handler, while the GL context is still current
+        self.scene_canvas.events.draw.connect(self._on_canvas_draw, position='last')
+        self.scene_canvas.update()  # the first frame, even if nothing is redrawn for a while
+        self.canvas_timer = QTimer()
+        self.canvas_timer.timeout.connect(self._on_canvas_tick)
+        self.canvas_timer.start(int(1000 / self.FPS))
+
+    def _stop_canvas_capture(self):
+        self.canvas_timer.stop()
+        self.canvas_timer = None
+        self.scene_canvas.events.draw.disconnect(self._on_canvas_draw)
+        self.scene_canvas = None
+
+    def _on_canvas_tick(self):
+        """Tell the encoder the canvas still shows the last frame when no redraw was read this tick"""
+        pts = time.perf_counter() - self.capture_origin
+        if self.is_recording and pts >= self.next_canvas_grab and not self.canvas_grab_pending:
+            self._queue_frame((pts, None))
+
+    def _on_canvas_draw(self, event):
+        """Queue the frame just rendered, at most FPS times per second (runs on the GUI thread)
+
+        vispy only redraws when the scene changed, so a static view costs
+        nothing. Redraws closer together than 1 / FPS are not read; instead one
+        more redraw is requested for when the next frame is due, so the final
+        state after fast interaction is always recorded.
+        """
+        from vispy.gloo import read_pixels
+
+        if not self.is_recording:
+            return
+        pts = time.perf_counter() - self.capture_origin
+        if pts < self.next_canvas_grab:
+            if not self.canvas_grab_pending:
+                self.canvas_grab_pending = True
+                QTimer.singleShot(int((self.next_canvas_grab - pts) * 1000) + 1, self._request_canvas_frame)
+            return
+        self.next_canvas_grab = pts + 1 / self.FPS
+        try:
+            # the current viewport in physical pixels, rows top to bottom
+            img = read_pixels(alpha=True)
+            if self._frame_changed(img):
+                self._queue_frame((pts, img))
+        except Exception as e:
+            print(f"capture error: {str(e)}")
+
+    def _request_canvas_frame(self):
+        self.canvas_grab_pending = False
+        if self.is_recording and self.scene_canvas is not None:
+            self.scene_canvas.update()
+
+    def _frame_changed(self, img):
+        """Whether a frame differs from the last queued one (always true while an annotation is shown)"""
+        if not self.text_queue.empty():
+            # the encoder draws the overlay, so every frame is needed until it expires
+            self.last_signature = None
+            return True
+        # a checksum of every pixel, read straight from the frame buffer (zlib releases the GIL)
+        signature = (img.shape, zlib.crc32(np.ascontiguousarray(img)))
+        if signature == self.last_signature:
+            self.unchanged_frames += 1
+            return False
+        self.last_signature = signature
+        return True
+
     def _capture_loop(self):
+        """Grab frames on a fixed FPS schedule and queue the changed ones with their capture timestamp"""
         with mss() as sct:
-            last_capture_time = time.perf_counter()
+            frame_index = 0
             while self.is_recording:
                 try:
-                    elapsed = time.perf_counter() - last_capture_time
-                    sleep_time = max(0, (1/self.FPS) - elapsed)
-                    time.sleep(sleep_time)
-                    
-                    last_capture_time = time.perf_counter()
-                    
-                    # 优化图像捕获流程
-                    img = np.array(sct.grab(self.monitor))
-                    img = cv2.cvtColor(img[..., :3], cv2.COLOR_BGR2RGB)
-                    
-                    # 分离文字绘制到独立线程
-                    if not self.text_queue.empty():
-                        img = self._draw_text(img)
-                    
-                    # 使用线程锁写入视频
-                    with threading.Lock():
-                        self.writer.append_data(img)
+                    # sleep until the next tick of the absolute schedule, so late ticks do not accumulate drift
+                    deadline = self.capture_origin + frame_index / self.FPS
+                    time.sleep(max(0, deadline - time.perf_counter()))
+                    pts = time.perf_counter() - self.capture_origin
+                    frame_index = int(pts * self.FPS) + 1
 
+                    shot = sct.grab(self.monitor)
+                    # zero-copy BGRA view on the grabbed buffer
+                    img = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+                    # an unchanged screen only queues a marker, the encoder holds the previous frame
+                    self._queue_frame((pts, img if self._frame_changed(img) else None))
                 except Exception as e:
                     print(f"capture error: {str(e)}")
                     continue
+        # tell the encoder where the recording ends
+        self._queue_frame((time.perf_counter() - self.capture_origin, None), block=True)
+        self.frame_queue.put(None)
+
+    def _queue_frame(self, item, block=False):
+        """Put a frame on the encoder queue, applying DROP_POLICY when the queue is full"""
+        if block:
+            self.frame_queue.put(item)
+            return
+        try:
+            self.frame_queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        self.dropped_frames += 1
+        if DROP_POLICY == 'oldest':
+            try:
+                self.frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.frame_queue.put_nowait(item)
+            except queue.Full:
+                pass
+
+    def _encode_loop(self):
+        """Convert, annotate and write queued frames, placing each at its capture time.
+
+        With an ENCODER_PRESET each changed frame is written once with its
+        capture timestamp and shown until the next one; ffmpeg repeats it for
+        a constant frame rate, unless VARIABLE_FRAME_RATE is set. The imageio
+        writer has a constant frame rate only, so frame n is shown at n / FPS:
+        every queued frame or unchanged marker first fills the slots up to its
+        timestamp with the previous frame, and a frame that maps to an already
+        written slot is skipped. Either way the video duration follows
+        wall-clock time even when capture or encoding could not keep up.
+        """
+        timestamped = bool(self.ENCODER_PRESET)
+        written = 0  # slots written to the imageio writer
+        last = None
+        last_pts = None  # capture time of the last written frame
+        end_pts = None  # capture time of the last queued item, the end of the recording
+        while True:
+            item = self.frame_queue.get()
+            if item is None:
+                break
+            pts, img = item
+            end_pts = pts
+            slot = int(round(pts * self.FPS))
+            try:
+                if img is None:
+                    # unchanged screen: the previous frame is still shown at pts
+                    while not timestamped and last is not None and written <= slot:
+                        self.writer.append_data(last)
+                        written += 1
+                        self.duplicated_frames += 1
+                    continue
+                if slot < written and not timestamped:
+                    continue
+                if self.writer is None:
+                    self.writer = self._open_writer(img.shape)
+                bgra = self.pixel_format == 'bgra'
+                if self.ENCODER_PRESET:
+                    # ffmpeg takes BGRA/RGBA as is; only frames with a text overlay are converted for PIL
+                    if not self.text_queue.empty():
+                        rgb = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB if bgra else cv2.COLOR_RGBA2RGB)
+                        img = cv2.cvtColor(self._draw_text(rgb), cv2.COLOR_RGB2BGRA if bgra else cv2.COLOR_RGB2RGBA)
+                    self.writer.append_data(img, pts)
+                else:
+                    img = cv2.cvtColor(img[..., :3], cv2.COLOR_BGR2RGB) if bgra else np.ascontiguousarray(img[..., :3])
+                    if not self.text_queue.empty():
+                        img = self._draw_text(img)
+                    while written < slot:
+                        # before the first frame there is nothing to repeat, start with this one
+                        self.writer.append_data(last if last is not None else img)
+                        written += 1
+                        self.duplicated_frames += 1
+                    self.writer.append_data(img)
+                    written += 1
+                last = img
+                last_pts = pts
+            except Exception as e:
+                print(f"encode error: {str(e)}")
+        if timestamped and last is not None and end_pts > last_pts:
+            # repeat the last frame at the stop time, so it is shown until the recording ended
+            try:
+                self.writer.append_data(last, end_pts)
+            except Exception as e:
+                print(f"encode error: {str(e)}")
+
+    def _open_writer(self, shape):
+        """Open the video writer for frames of the given (height, width, channels) shape"""
+        if self.ENCODER_PRESET:
+            return FFmpegPipeWriter(self.video_path, shape[1], shape[0], self.FPS, preset=self.ENCODER_PRESET,
+                                    pix_fmt=self.pixel_format, variable_frame_rate=self.VARIABLE_FRAME_RATE)
+        return get_writer(self.video_path, format='FFMPEG', fps=self.FPS)
 
     def stop_recording(self):
         # stop the recording
@@ -193,8 +417,22 @@ class ScreenRecorder:
                 f"[Duration] {duration.total_seconds():.2f} seconds\n\n"
             )
 
+        if self.scene_canvas is not None:
+            self._stop_canvas_capture()
+            # tell the encoder where the recording ends
+            self._queue_frame((time.perf_counter() - self.capture_origin, None), block=True)
+            self.frame_queue.put(None)
         if self.capture_thread:
             self.capture_thread.join()
+        if self.encoder_thread:
+            self.encoder_thread.join()
+        if self.dropped_frames or self.duplicated_frames:
+            print(f"Recording: {self.dropped_frames} frames dropped, {self.duplicated_frames} repeated to keep timing")
+        if self.unchanged_frames:
+            print(f"Recording: {self.unchanged_frames} unchanged frames skipped")
         if self.writer:
             self.writer.close()
-        print(f"The video is saved at: {os.path.abspath(self.video_path)}")
+            print(f"The video is saved at: {os.path.abspath(self.video_path)}")
+        if self.session_logger is not None:
+            self.session_logger.stop()
+            self.session_logger = None
@@ -0,0 +1,77 @@
+import os
+import sys
+sys.path.append(os.path.dirname(__file__)+'/napari-nifti-main/src/')
+import napari
+from qtpy.QtCore import QTimer
+from napari_nifti._reader import napari_get_reader
+from napari_nifti._cache import VolumeCache
+from session_log import read_session, resolve_path, SessionReplay
+from viewer_module import ViewerUI
+
+RECORD_PATH = os.path.dirname(__file__)+'/recorded_materials/'
+EXPORT_FPS = 15  # frame rate of exported videos
+EXPORT_PRESET = 'live'  # see utils.ffmpeg_writer.ENCODER_PRESETS
+
+
+def open_session(log_path):
+    """Load the file of a session log into a ViewerUI and return the viewer with a replay of the log"""
+    records = read_session(log_path)
+    source = records[0]['source']
+    if not source:
+        print(f"The session log does not name its source file: {log_path}")
+        sys.exit(1)
+    filepath = resolve_path(source)
+    if not os.path.exists(filepath):
+        print(f"File path does not exist: {filepath}")
+        sys.exit(1)
+
+    reader = napari_get_reader(filepath)
+    if not reader:
+        print("Cannot find file reader")
+        sys.exit(1)
+    volume_cache = VolumeCache()
+    layer_data = reader(filepath, lazy=True, cache=volume_cache)
+    if not layer_data:
+        print("Cannot read layer data")
+        sys.exit(1)
+
+    # the same viewer as during the session, so setting the step redraws the views the same way
+    viewer3d = ViewerUI(image_array=layer_data[0][0], metadata=layer_data[0][1], filepath=filepath,
+                        recorder=None, RECORD_PATH=RECORD_PATH, volume_cache=volume_cache)
+    viewer = viewer3d.get_viewer()
+    print(f"File: {os.path.basename(filepath)}")
+    print(f"Session: {len(records)} events, {records[-1]['t']:.1f} seconds")
+    return viewer, SessionReplay(viewer, records, ui=viewer3d)
+
+
+def replay(log_path, speed=1.0):
+    """Replay a session interactively"""
+    viewer, session = open_session(log_path)
+    # start once the window is shown
+    QTimer.singleShot(500, lambda: session.play(speed))
+    napari.run()
+
+
+def export(log_path, video_path, fps=EXPORT_FPS):
+    """Render a session to a video without user interaction (batch job)"""
+    viewer, session = open_session(log_path)
+    session.export_video(video_path, fps=fps, preset=EXPORT_PRESET)
+    viewer.close()
+
+
+if __name__ == "__main__":
+    # replay_session.py <session.jsonl> [--speed N] [--export video.mp4]
+    args = sys.argv[1:]
+    if len(args) < 1:
+        print("Usage: replay_session.py <session.jsonl> [--speed N] [--export video.mp4]")
+        sys.exit(1)
+    log_path = args[0].strip('"')
+    if not os.path.exists(log_path):
+        print(f"File path does not exist: {log_path}")
+        sys.exit(1)
+
+    if '--export' in args and args.index('--export') + 1 < len(args):
+        export(log_path, args[args.index('--export') + 1].strip('"'))
+    else:
+        speed = float(args[args.index('--speed') + 1]) if '--speed' in args and args.index('--speed') + 1 < len(args) else 1.0
+        replay(log_path, speed)
@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.ndimage import rotate
+
+ANGLE_STEP = 10  # degrees between precomputed projections
+MAX_WORKERS = 4  # processes rendering angles in parallel, each holding one slab
+MIP_SLAB = 16  # axial slices rotated at a time, bounds the working set of a worker
+
+_volume = None  # the volume of a pool worker, memory-mapped by _init_worker instead of sent with every task
+
+
+def _init_worker(filename):
+    global _volume
+    _volume = np.load(filename, mmap_mode='r')
+
+
+def _project(angle, volume=None, slab=MIP_SLAB):
+    """MIP of a volume (the worker's by default) rotated by ``angle`` degrees about the cranio-caudal (z) axis"""
+    volume = _volume if volume is None else volume
+    nz, ny, nx = volume.shape
+    frame = np.empty((nz, nx), dtype=volume.dtype)
+    # axial slices rotate independently, so a slab at a time gives the same result with bounded memory
+    for z0 in range(0, nz, slab):
+        rotated = rotate(np.asarray(volume[z0:z0 + slab]), angle, axes=(1, 2), reshape=False, order=1,
+                         mode='constant', cval=0.0)
+        frame[z0:z0 + slab] = rotated.max(axis=1)
+    return frame
+
+
+def compute_rotating_mip(volume, step=ANGLE_STEP, workers=None, filename=None):
+    """Return MIPs at ``step`` degree intervals around z as an (angles, rows, columns) stack.
+
+    Only the first half turn is rendered: a view from ``angle + 180`` sees the
+    same maxima mirrored left to right. Rows are flipped like the viewer's
+    other views, so the head is up. With ``filename`` (a .npy copy of the
+    volume) the angles are rendered in a pool of at most MAX_WORKERS
+    processes that each memory-map the file, otherwise one angle after the
+    other in this process; either way only MIP_SLAB slices per process are
+    held in memory at once.
+    """
+    angles = np.arange(0, 360, step)
+    half = angles[angles < 180]
+    mirrored = (180 % step == 0)
+    todo = half if mirrored else angles
+    workers = min(workers or os.cpu_count() or 1, MAX_WORKERS, len(todo))
+    if filename is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(filename,)) as executor:
+            frames = np.stack(list(executor.map(_project, todo)))
+    else:
+        frames = np.stack([_project(angle, volume) for angle in todo])
+    if mirrored:
+        frames = np.concatenate([frames, frames[:, :, ::-1]])
+    return np.ascontiguousarray(frames[:, ::-1, :])
+
+
+def _volume_file(volume, filepath=None, cache=None):
+    """Return ``(filename, temporary)`` of a .npy file holding ``volume`` for the pool workers (None without one)"""
+    if isinstance(volume, np.memmap) and str(volume.filename).endswith('.npy') and volume.flags.c_contiguous:
+        # already a memory-mapped cache entry or display copy, unless this is a view on part of it
+        on_disk = np.load(volume.filename, mmap_mode='r')
+        if (on_disk.shape, on_disk.dtype, on_disk.offset) == (volume.shape, volume.dtype, volume.offset):
+            return str(volume.filename), False
+    if cache is None or not filepath:
+        return None, False
+    suffix = "_rotmip_volume.npy"
+
+    def fill(out):
+        for z0 in range(0, volume.shape[0], MIP_SLAB):
+            out[z0:z0 + MIP_SLAB] = np.asarray(volume[z0:z0 + MIP_SLAB])
+
+    try:
+        cache.create_array(filepath, suffix, volume.shape, volume.dtype, fill)
+    except OSError as e:
+        print(f"Could not cache volume for the rotating MIP of {filepath}: {str(e)}")
+        return None, False
+    return cache.path_for(filepath, suffix), True
+
+
+def load_rotating_mip(volume, filepath=None, cache=None, step=ANGLE_STEP, workers=None):
+    """Return the rotating MIP stack of a volume, cached per file version and angle step"""
+    suffix = f"_rotmip_{step}.npy"
+    if cache is not None and filepath:
+        frames = cache.load_array(filepath, suffix)
+        if frames is not None and frames.dtype == volume.dtype and frames.shape[1:] == (volume.shape[0], volume.shape[2]):
+            return frames
+    filename, temporary = _volume_file(volume, filepath, cache)
+    try:
+        frames = compute_rotating_mip(volume, step, workers, filename=filename)
+    finally:
+        if temporary:
+            os.remove(filename)
+    if cache is not None and filepath:
+        try:
+            cache.store_array(filepath, suffix, frames)
+        except OSError as e:
+            print(f"Could not cache rotating MIP of {filepath}: {str(e)}")
+    return frames
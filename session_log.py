@@ -0,0 +1,355 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from qtpy.QtCore import QTimer
+from qtpy.QtWidgets import QApplication
+
+SESSION_LOG_VERSION = 2
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DERIVED_LAYERS = ('Section Lines',)  # layer name prefixes redrawn from the current step, never logged
+LAYER_PROPERTIES = ('contrast_limits', 'visible', 'opacity')  # logged for every layer
+SHAPES_PROPERTIES = ('scale', 'translate')  # placement of a shapes layer, e.g. on the sagittal view
+SHAPES_STYLE = ('edge_width', 'edge_color', 'face_color')  # per shape, logged with the data
+DECIMALS = 3  # rounding of logged coordinates, zoom and contrast
+
+
+def portable_path(path):
+    """Path as written to a session log: relative to the project when inside it"""
+    if path and os.path.isabs(path) and path.startswith(PROJECT_ROOT):
+        return os.path.relpath(path, PROJECT_ROOT)
+    return path
+
+
+def resolve_path(path):
+    """Absolute path of a path read from a session log"""
+    return path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+
+
+def _compact(value):
+    """JSON-friendly copy of an event value with floats rounded to DECIMALS"""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, dict):
+        return {key: _compact(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), DECIMALS)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return value
+
+
+class SessionLogger:
+    """Write the viewer state changes of a session as timestamped JSON lines.
+
+    Each line is ``{"t": seconds since start, "e": kind, ...}``. The first
+    line (``start``) holds the source file and the full initial state; after
+    that only changes are written: the dims step, the camera, layer display
+    properties and the data, placement and style of annotation (shapes)
+    layers. Step and camera changes of one event loop tick (e.g. while
+    dragging a slider) are written once, so an hour of reading is a few
+    kilobytes. ``ui_state`` returns the display state kept outside the
+    napari layers (see ``ViewerUI.session_state``); it goes into the
+    ``start`` line, and its owner writes changes with ``log('ui', ...)``.
+    """
+
+    def __init__(self, viewer, source=None, ui_state=None):
+        self.viewer = viewer
+        self.source = source
+        self.ui_state = ui_state
+        self.path = None
+        self.file = None
+        self.start_time = None
+        self.connections = []  # (emitter, callback) pairs to disconnect on stop
+        self.layer_connections = {}  # {layer: [(emitter, callback)]}
+        self.pending = {}  # {kind: record} written on the next event loop tick
+        self.flush_pending = False
+
+    def is_logging(self):
+        return self.file is not None
+
+    def start(self, path):
+        """Open the log at ``path``, write the initial state and connect the viewer events"""
+        self.path = path
+        # line buffered, so the log survives a crash of the viewer
+        self.file = open(path, 'w', buffering=1)
+        self.start_time = time.perf_counter()
+        self._write({
+            'e': 'start',
+            'version': SESSION_LOG_VERSION,
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'source': portable_path(self.source),
+            'step': self.viewer.dims.current_step,
+            'camera': self._camera_state(),
+            'layers': [self._layer_state(layer) for layer in self.viewer.layers if self._is_logged(layer)],
+            'ui': self.ui_state() if self.ui_state is not None else None,
+        })
+        self._connect(self.viewer.dims.events.current_step, self._on_step)
+        for name in ('center', 'zoom', 'angles'):
+            self._connect(getattr(self.viewer.camera.events, name), self._on_camera)
+        self._connect(self.viewer.layers.events.inserted, self._on_layer_inserted)
+        self._connect(self.viewer.layers.events.removed, self._on_layer_removed)
+        for layer in self.viewer.layers:
+            self._connect_layer(layer)
+
+    def stop(self):
+        """Disconnect from the viewer and close the log"""
+        if self.file is None:
+            return
+        self._flush()
+        for emitter, callback in self.connections:
+            emitter.disconnect(callback)
+        for connections in self.layer_connections.values():
+            for emitter, callback in connections:
+                emitter.disconnect(callback)
+        self.connections = []
+        self.layer_connections = {}
+        self._write({'e': 'stop'})
+        self.file.close()
+        self.file = None
+        print(f"The session log is saved at: {os.path.abspath(self.path)}")
+
+    def log(self, kind, **fields):
+        """Write an event that is not a viewer event, e.g. an annotation text"""
+        if self.file is not None:
+            self._flush()
+            self._write(dict(e=kind, **fields))
+
+    def _write(self, record):
+        record = {'t': round(time.perf_counter() - self.start_time, DECIMALS), **record}
+        try:
+            self.file.write(json.dumps(_compact(record), separators=(',', ':')) + '\n')
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Session log error: {str(e)}")
+
+    def _connect(self, emitter, callback, layer=None):
+        emitter.connect(callback)
+        if layer is None:
+            self.connections.append((emitter, callback))
+        else:
+            self.layer_connections.setdefault(layer, []).append((emitter, callback))
+
+    def _defer(self, kind, record):
+        """Keep only the latest record of a kind until the next event loop tick"""
+        self.pending[kind] = record
+        if not self.flush_pending:
+            self.flush_pending = True
+            QTimer.singleShot(0, self._flush)
+
+    def _flush(self):
+        self.flush_pending = False
+        pending, self.pending = self.pending, {}
+        if self.file is not None:
+            for record in pending.values():
+                self._write(record)
+
+    def _camera_state(self):
+        camera = self.viewer.camera
+        return {'center': camera.center, 'zoom': camera.zoom, 'angles': camera.angles}
+
+    def _is_logged(self, layer):
+        return not layer.name.startswith(DERIVED_LAYERS)
+
+    def _layer_state(self, layer):
+        state = {'name': layer.name, 'type': type(layer).__name__}
+        for name in LAYER_PROPERTIES:
+            if hasattr(layer, name):
+                state[name] = getattr(layer, name)
+        if type(layer).__name__ == 'Shapes':
+            state.update(self._shapes_state(layer))
+        return state
+
+    def _shapes_state(self, layer):
+        state = {'data': [np.asarray(shape) for shape in layer.data], 'shape_type': list(layer.shape_type),
+                 'ndim': layer.ndim}
+        for name in SHAPES_PROPERTIES + SHAPES_STYLE:
+            state[name] = getattr(layer, name)
+        return state
+
+    def _connect_layer(self, layer):
+        if not self._is_logged(layer):
+            return
+        for name in LAYER_PROPERTIES:
+            emitter = getattr(layer.events, name, None)
+            if emitter is not None:
+                self._connect(emitter, lambda event, layer=layer, name=name: self._on_layer_property(layer, name), layer)
+        if type(layer).__name__ == 'Shapes':
+            self._connect(layer.events.data, lambda event, layer=layer: self._on_shapes(layer), layer)
+
+    def _on_step(self, event):
+        self._defer('step', {'e': 'step', 'step': self.viewer.dims.current_step})
+
+    def _on_camera(self, event):
+        self._defer('camera', dict(e='camera', **self._camera_state()))
+
+    def _on_layer_inserted(self, event):
+        layer = event.value
+        if self._is_logged(layer):
+            self._flush()
+            self._write(dict(e='layer_added', **self._layer_state(layer)))
+            self._connect_layer(layer)
+
+    def _on_layer_removed(self, event):
+        layer = event.value
+        for emitter, callback in self.layer_connections.pop(layer, []):
+            emitter.disconnect(callback)
+        if self._is_logged(layer):
+            self._flush()
+            self._write({'e': 'layer_removed', 'name': layer.name, 'type': type(layer).__name__})
+
+    def _on_layer_property(self, layer, name):
+        self._defer((layer.name, name), {'e': 'layer', 'name': layer.name, name: getattr(layer, name)})
+
+    def _on_shapes(self, layer):
+        self._defer((layer.name, 'data'), dict(e='shapes', name=layer.name, **self._shapes_state(layer)))
+
+
+def read_session(path):
+    """Return the records of a session log, the ``start`` record first"""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records or records[0].get('e') != 'start':
+        raise ValueError(f"{path} is not a session log")
+    return records
+
+
+class SessionReplay:
+    """Re-apply a logged session to a viewer showing the same file.
+
+    The viewer is expected to have been set up like the recorded one (e.g. a
+    ViewerUI for the ``source`` file), so setting the dims step redraws the
+    orthogonal views exactly as during the session. Shapes layers missing
+    from the viewer are created where they were drawn; other missing layers
+    are ignored. With ``ui`` (the ViewerUI) the slab projection, curved
+    reformation and linked series are restored as well.
+    """
+
+    def __init__(self, viewer, records, ui=None):
+        self.viewer = viewer
+        self.records = records
+        self.ui = ui
+        self.position = 0  # index of the next record to apply
+        self.timer = None
+        self.play_origin = None
+        self.speed = 1.0
+
+    @property
+    def duration(self):
+        return self.records[-1]['t']
+
+    def apply(self, record):
+        """Apply one record to the viewer"""
+        kind = record['e']
+        if kind == 'start':
+            self._set_step(record['step'])
+            self._set_camera(record['camera'])
+            for state in record['layers']:
+                self._set_layer(state)
+            if record.get('ui') and self.ui is not None:
+                self.ui.apply_session_state(record['ui'])
+        elif kind == 'step':
+            self._set_step(record['step'])
+        elif kind == 'camera':
+            self._set_camera(record)
+        elif kind in ('layer', 'layer_added', 'shapes'):
+            self._set_layer(record)
+        elif kind == 'layer_removed' and record.get('type') == 'Shapes' and record['name'] in self.viewer.layers:
+            # image layers are managed by the viewer (e.g. replaced when a volume is reloaded), shapes by the user
+            self.viewer.layers.remove(record['name'])
+        elif kind == 'ui' and self.ui is not None:
+            self.ui.apply_session_state(record)
+        elif kind == 'annotation':
+            print(f"[{record['t']:.1f} s] {record.get('text', '')}")
+
+    def seek(self, t):
+        """Apply every record up to ``t`` seconds; return whether anything was applied"""
+        if self.position and self.records[self.position - 1]['t'] > t:
+            self.position = 0  # seeking backwards replays from the start
+        applied = False
+        while self.position < len(self.records) and self.records[self.position]['t'] <= t:
+            try:
+                self.apply(self.records[self.position])
+            except Exception as e:
+                print(f"Replay error at {self.records[self.position]['t']} s: {str(e)}")
+            self.position += 1
+            applied = True
+        return applied
+
+    def play(self, speed=1.0, interval_ms=20):
+        """Replay the session in real time (or ``speed`` times faster) in the running Qt event loop"""
+        self.speed = speed
+        self.position = 0
+        self.play_origin = time.perf_counter()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self._tick)
+        self.timer.start(interval_ms)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+
+    def _tick(self):
+        self.seek((time.perf_counter() - self.play_origin) * self.speed)
+        if self.position >= len(self.records):
+            self.stop()
+
+    def export_video(self, path, fps=15, preset='live'):
+        """Render the session offline to a video at a constant frame rate.
+
+        Frames are rendered only when a record was applied since the previous
+        frame; otherwise the previous frame is written again, so long static
+        stretches cost almost nothing.
+        """
+        from utils.ffmpeg_writer import FFmpegPipeWriter
+
+        writer = None
+        frame = None
+        self.position = 0
+        for n in range(int(self.duration * fps) + 1):
+            if self.seek(n / fps) or frame is None:
+                # let the viewer's coalesced redraws run before the canvas is read
+                QApplication.processEvents()
+                frame = self.viewer.screenshot(canvas_only=True, flash=False)
+            if writer is None:
+                writer = FFmpegPipeWriter(path, frame.shape[1], frame.shape[0], fps, preset=preset, pix_fmt='rgba')
+            writer.append_data(frame)
+        if writer is not None:
+            writer.close()
+            print(f"The video is saved at: {os.path.abspath(path)}")
+
+    def _set_step(self, step):
+        self.viewer.dims.current_step = tuple(step)
+
+    def _set_camera(self, state):
+        camera = self.viewer.camera
+        camera.center = tuple(state['center'])
+        camera.zoom = state['zoom']
+        camera.angles = tuple(state['angles'])
+
+    def _set_layer(self, state):
+        name = state['name']
+        if name not in self.viewer.layers:
+            if 'shape_type' not in state:
+                return
+            self.viewer.add_shapes(name=name, ndim=state.get('ndim', 2))
+        layer = self.viewer.layers[name]
+        # placed before the data is set, so the shapes land on the view they were drawn on
+        for prop in SHAPES_PROPERTIES:
+            if prop in state:
+                setattr(layer, prop, state[prop])
+        if 'data' in state:
+            layer.data = [(np.asarray(shape), shape_type) for shape, shape_type in zip(state['data'], state['shape_type'])]
+            if len(layer.data):
+                for prop in SHAPES_STYLE:
+                    if prop in state:
+                        setattr(layer, prop, state[prop])
+        for prop in LAYER_PROPERTIES:
+            if prop in state:
+                setattr(layer, prop, state[prop])
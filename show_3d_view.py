@@ -7,16 +7,27 @@ import napari
 from napari import Viewer
 import nibabel as nib
 from qtpy.QtWidgets import QApplication
+from napari_nifti._cache import VolumeCache
+from rotating_mip import load_rotating_mip
+from utils.intensity import display_window
 
-def show_3d_view(filepath):
-    """Display 3D view of NIFTI file"""
+MAX_3D_VOXELS = 256 ** 3  # largest volume uploaded to the GPU for rendering, bigger ones use a pyramid level
+
+def show_3d_view(filepath, level=None):
+    """Display 3D view of NIFTI file
+
+    napari renders a multiscale layer in 3D from its coarsest level only, so
+    the volume is passed as a plain image: level 0 when it has at most
+    MAX_3D_VOXELS voxels, otherwise the finest pyramid level that does (or
+    ``level`` when given).
+    """
     # Read image data
     reader = napari_get_reader(filepath)
     if not reader:
         print("Cannot find file reader")
         sys.exit(1)
         
-    layer_data = reader(filepath)
+    layer_data = reader(filepath, lazy=True, cache=True)
     if not layer_data:
         print("Cannot read layer data")
         sys.exit(1)
@@ -24,6 +35,14 @@ def show_3d_view(filepath):
     # Extract image data
     image_array = layer_data[0][0]
     metadata = layer_data[0][1]
+    if level is None and image_array.size > MAX_3D_VOXELS:
+        level = next((i for i in range(1, 8) if image_array.size // 8 ** i <= MAX_3D_VOXELS), 7)
+    if level:
+        # cached pyramid, [full, /2, /4, ...] down to the requested level
+        image_levels = reader(filepath, lazy=True, cache=True, multiscale=level)[0][0]
+        level = min(level, len(image_levels) - 1)
+        image_array = image_levels[level]
+    level = level or 0
     
     # Create viewer
     viewer = Viewer(title="3D file")
@@ -32,6 +51,7 @@ def show_3d_view(filepath):
     # Add volume rendering
     volume_layer = viewer.add_image(
         image_array,
+        scale=(2 ** level,) * image_array.ndim,  # same world extent as the full resolution volume
         rendering='mip',  # Maximum intensity projection
         name='3D render image',
         blending='additive',
@@ -43,19 +63,56 @@ def show_3d_view(filepath):
     
     # Display file information
     print(f"File: {os.path.basename(filepath)}")
-    print(f"Data shape: {image_array.shape}")
+    print(f"Data shape: {image_array.shape} (pyramid level {level})")
     
     # Run napari
     napari.run()
 
+def show_rotating_mip(filepath):
+    """Play back precomputed MIPs around the cranio-caudal axis, for machines without a usable GPU"""
+    reader = napari_get_reader(filepath)
+    if not reader:
+        print("Cannot find file reader")
+        sys.exit(1)
+
+    cache = VolumeCache()
+    layer_data = reader(filepath, lazy=True, cache=cache)
+    if not layer_data:
+        print("Cannot read layer data")
+        sys.exit(1)
+    image_array = layer_data[0][0]
+    spacing = layer_data[0][1]['metadata']['spacing']
+
+    # computed once in a process pool, then every rotation step is an image swap
+    print("Computing rotating MIP...")
+    frames = load_rotating_mip(image_array, filepath, cache)
+
+    viewer = Viewer(title="3D file")
+    viewer.window._qt_window.resize(800, 600)
+    viewer.add_image(
+        frames,
+        name='Rotating MIP',
+        contrast_limits=display_window(filepath, image_array),
+        scale=(1, spacing[0], spacing[2]),
+    )
+    viewer.dims.axis_labels = ('angle', 'z', 'x')
+    viewer.dims.set_current_step(0, 0)
+
+    print(f"File: {os.path.basename(filepath)}")
+    print(f"MIP frames: {frames.shape}")
+    napari.run()
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    # --rotating-mip: precomputed 2D MIP playback instead of volume rendering
+    rotating = '--rotating-mip' in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != '--rotating-mip']
+    if len(args) < 1:
         # Use default file
         default_file = "T2G002_MRI_Spine_t2_space_sag_p2_iso_20240820161941_19001.nii.gz"
         print(f"No file specified, using default file: {default_file}")
         file_name = default_file
     else:
-        file_name = sys.argv[1].strip('"')  # Remove potential quotes
+        file_name = args[0].strip('"')  # Remove potential quotes
         
     # Build file path
     IMAGE_PATH = os.path.join(os.path.dirname(__file__), 'data')
@@ -67,4 +124,7 @@ if __name__ == "__main__":
         sys.exit(1)
         
     # Show 3D view
-    show_3d_view(filepath)
\ No newline at end of file
+    if rotating:
+        show_rotating_mip(filepath)
+    else:
+        show_3d_view(filepath)
\ No newline at end of file
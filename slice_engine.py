@@ -0,0 +1,331 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+from utils.intensity import slab_size
+
+# volume axis each view slices through; z, y, x = 0, 1, 2
+VIEW_AXES = {
+    'axial': 0,
+    'coronal': 1,
+    'sagittal': 2,
+}
+# (row, column) volume axes of each displayed view; rows are shown flipped
+DISPLAY_AXES = {
+    'axial': (1, 2),
+    'coronal': (0, 2),
+    'sagittal': (0, 1),
+}
+SLAB = 32  # slices read at once while building reoriented stacks
+CACHE_SLICES = 64  # slices kept per engine when reading from a lazy volume
+PREFETCH_DEPTH = 8  # slices read ahead in the scroll direction
+SLAB_MODES = ('max', 'min', 'mean')  # MIP, MinIP and average intensity projection
+SLAB_BLOCKS = 4  # precomputed MIP/MinIP blocks kept per projector
+REGION_MARGIN = 16  # voxels read around a resampling region of a lazy volume, for reuse
+
+
+def sample_volume(volume, coords, order=1, region=None, margin=REGION_MARGIN):
+    """``map_coordinates`` for any volume, reading only the region the coordinates cover.
+
+    In-memory and memory-mapped arrays are sampled directly. Lazy and chunked
+    volumes are read just within the bounding box of ``coords`` (3, ...), so
+    an oblique plane or a curved surface touches only the chunks it crosses.
+    Passing the same ``region`` dict on every call keeps the last region read
+    (padded by ``margin`` voxels) and reuses it while the coordinates stay
+    inside, e.g. while scrolling or dragging a control point. Points outside
+    the volume are 0.
+    """
+    if isinstance(volume, np.ndarray):
+        return map_coordinates(volume, coords, order=order, mode='constant', cval=0.0, prefilter=False)
+    flat = coords.reshape(3, -1)
+    shape = np.array(volume.shape[:3])
+    lower = np.maximum(np.floor(flat.min(axis=1)).astype(int), 0)
+    upper = np.minimum(np.ceil(flat.max(axis=1)).astype(int) + 1, shape)
+    if np.any(upper <= lower):
+        return np.zeros(coords.shape[1:], dtype=np.float32)
+    if region is None:
+        region = {}
+    if not region or np.any(lower < region['lower']) or np.any(upper > region['upper']):
+        region['lower'] = np.maximum(lower - margin, 0)
+        region['upper'] = np.minimum(upper + margin, shape)
+        (z0, y0, x0), (z1, y1, x1) = region['lower'], region['upper']
+        region['data'] = np.asarray(volume[z0:z1, y0:y1, x0:x1])
+    shift = region['lower'].reshape((3,) + (1,) * (coords.ndim - 1)).astype(coords.dtype)
+    return map_coordinates(region['data'], coords - shift, order=order, mode='constant', cval=0.0, prefilter=False)
+
+
+class _BuildCancelled(Exception):
+    """Raised inside a stack build when its engine is closed"""
+
+
+class SliceEngine:
+    """Serve display-oriented 2D slices of a (z, y, x) volume.
+
+    The display orientation used by the viewer, ``np.fliplr(np.rot90(s, k=2))``,
+    is a flip of the first displayed axis. In-memory volumes are sliced and
+    flipped on request, which is cheap and needs no extra copy of the volume.
+    For lazy or memory-mapped volumes, where a sagittal slice gathers from
+    the whole file, the engine writes one reoriented C-contiguous stack per
+    view to the volume cache (when ``cache`` and ``path`` are given) and
+    memory-maps it, so ``get(view, index)`` is a contiguous view that
+    allocates nothing. Stacks already in the cache are used at once; missing
+    ones are built by a background thread, and until a view's stack is ready
+    (or without a cache) its slices are read through a ``SliceCache`` that
+    prefetches ahead of the scroll direction.
+    """
+
+    def __init__(self, volume, views=('sagittal', 'axial'), cache=None, path=None):
+        self.volume = volume
+        self.shape = tuple(volume.shape[:3])
+        self.stacks = {}  # {view: memory-mapped stack}, completed by the build thread
+        self.slice_cache = None
+        self.builder = None
+        self.stopped = False
+        if isinstance(volume, np.ndarray) and not isinstance(volume, np.memmap):
+            return
+        missing = list(views)
+        if cache is not None and path is not None:
+            for view in views:
+                stack = cache.load_array(path, self._stack_suffix(view))
+                if stack is not None and stack.shape == self.stack_shape(view):
+                    self.stacks[view] = stack
+                    missing.remove(view)
+        if missing:
+            self.slice_cache = SliceCache(self)
+            if cache is not None and path is not None:
+                self.builder = threading.Thread(target=self._build_stacks, args=(missing, cache, path), daemon=True)
+                self.builder.start()
+
+    def stack_shape(self, view):
+        """Shape of the reoriented stack of a view: (slices, rows, columns)"""
+        axis = VIEW_AXES[view]
+        return (self.shape[axis],) + tuple(s for i, s in enumerate(self.shape) if i != axis)
+
+    def slice_count(self, view):
+        return self.shape[VIEW_AXES[view]]
+
+    def get(self, view, index):
+        """Return the display-oriented slice ``index`` of a view"""
+        index = int(np.clip(index, 0, self.slice_count(view) - 1))
+        stack = self.stacks.get(view)
+        if stack is not None:
+            return stack[index]
+        if self.slice_cache is not None:
+            return self.slice_cache.get(view, index)
+        return self.read(view, index)
+
+    def get_range(self, view, start, stop):
+        """Return the display-oriented slices ``start:stop`` of a view as one (n, rows, columns) array"""
+        stack = self.stacks.get(view)
+        if stack is not None:
+            return stack[start:stop]
+        return np.stack([self.get(view, index) for index in range(start, stop)])
+
+    def close(self):
+        """Stop the prefetch and build threads, if any"""
+        self.stopped = True
+        if self.slice_cache is not None:
+            self.slice_cache.close()
+
+    def read(self, view, index):
+        """Read one display-oriented slice straight from the volume"""
+        key = [slice(None)] * 3
+        key[VIEW_AXES[view]] = index
+        return np.ascontiguousarray(np.asarray(self.volume[tuple(key)])[::-1])
+
+    def _build_stack(self, view, out):
+        """Fill ``out`` with the reoriented stack, reading the volume in contiguous z slabs"""
+        axis = VIEW_AXES[view]
+        nz = self.shape[0]
+        slab = slab_size(self.volume, SLAB)
+        for z0 in range(0, nz, slab):
+            if self.stopped:
+                raise _BuildCancelled()
+            z1 = min(z0 + slab, nz)
+            block = np.moveaxis(np.asarray(self.volume[z0:z1]), axis, 0)
+            if axis == 0:
+                # axial: y is the flipped display axis
+                out[z0:z1] = block[:, ::-1]
+            else:
+                # sagittal/coronal: z is the flipped display axis
+                out[:, nz - z1:nz - z0] = block[:, ::-1]
+        return out
+
+    def _stack_suffix(self, view):
+        # the dtype keeps stacks of original volumes and of display copies apart
+        return f"_{view}_{np.dtype(self.volume.dtype).name}.npy"
+
+    def _build_stacks(self, views, cache, path):
+        """Write the stacks of ``views`` to the volume cache one after the other (runs in the build thread)"""
+        for view in views:
+            try:
+                self.stacks[view] = cache.create_array(path, self._stack_suffix(view), self.stack_shape(view),
+                                                       self.volume.dtype, lambda out: self._build_stack(view, out))
+            except _BuildCancelled:
+                return
+            except OSError as e:
+                print(f"Could not cache {view} stack of {path}: {str(e)}")
+                return
+        # every view is served from its stack now
+        self.slice_cache.close()
+
+
+class SlabProjector:
+    """Thick-slab projection (MIP, MinIP or mean) of one view that updates as the slab slides.
+
+    The slab covers ``thickness`` slices centred on the requested index
+    (shifted inwards at the volume borders). Mean slabs keep a running sum, so
+    moving by one slice adds the entering and subtracts the leaving slice.
+    MIP/MinIP use the van Herk/Gil-Werman scheme: the stack is split into
+    blocks of ``thickness`` slices with a prefix and suffix max (min) per
+    block, and any slab is the max of one suffix and one prefix slice. Blocks
+    are computed on first use and the last ``SLAB_BLOCKS`` of them are kept,
+    so scrolling costs one elementwise reduction of two slices per step.
+    """
+
+    def __init__(self, engine, view, thickness, mode='max'):
+        if mode not in SLAB_MODES:
+            raise ValueError(f"Unknown slab mode: {mode}")
+        self.engine = engine
+        self.view = view
+        self.mode = mode
+        self.count = engine.slice_count(view)
+        self.thickness = int(np.clip(thickness, 1, self.count))
+        self.reduce = np.maximum if mode == 'max' else np.minimum
+        self.blocks = OrderedDict()  # {block index: (prefix, suffix)}
+        self.window = None  # (start, stop) covered by self.sum
+        self.sum = None
+
+    def slab_range(self, index):
+        """Return the (start, stop) slice range of the slab centred on ``index``"""
+        start = int(np.clip(index - self.thickness // 2, 0, self.count - self.thickness))
+        return start, start + self.thickness
+
+    def get(self, index):
+        start, stop = self.slab_range(index)
+        if self.thickness == 1:
+            return self.engine.get(self.view, start)
+        if self.mode == 'mean':
+            return self._mean(start, stop)
+        return self._extreme(start, stop)
+
+    def _mean(self, start, stop):
+        if self.window is not None and abs(start - self.window[0]) < self.thickness:
+            old_start, old_stop = self.window
+            # slide the running sum: add the slices entering the slab, drop the ones leaving it
+            if start > old_start:
+                self.sum += self.engine.get_range(self.view, old_stop, stop).sum(axis=0, dtype=np.float64)
+                self.sum -= self.engine.get_range(self.view, old_start, start).sum(axis=0, dtype=np.float64)
+            elif start < old_start:
+                self.sum += self.engine.get_range(self.view, start, old_start).sum(axis=0, dtype=np.float64)
+                self.sum -= self.engine.get_range(self.view, stop, old_stop).sum(axis=0, dtype=np.float64)
+        else:
+            self.sum = self.engine.get_range(self.view, start, stop).sum(axis=0, dtype=np.float64)
+        self.window = (start, stop)
+        return (self.sum / self.thickness).astype(np.float32)
+
+    def _block(self, k):
+        block = self.blocks.get(k)
+        if block is None:
+            data = self.engine.get_range(self.view, k * self.thickness, min((k + 1) * self.thickness, self.count))
+            block = (self.reduce.accumulate(data, axis=0), self.reduce.accumulate(data[::-1], axis=0)[::-1])
+            self.blocks[k] = block
+            while len(self.blocks) > SLAB_BLOCKS:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(k)
+        return block
+
+    def _extreme(self, start, stop):
+        k, offset = divmod(start, self.thickness)
+        suffix = self._block(k)[1][offset]
+        if offset == 0:
+            return suffix  # the slab is exactly one block
+        prefix = self._block(k + 1)[0][stop - 1 - (k + 1) * self.thickness]
+        return self.reduce(suffix, prefix)
+
+
+class SliceCache:
+    """Bounded LRU cache of display slices with a predictive prefetch thread.
+
+    Every ``get`` records the scroll direction and step size of its view and
+    asks the worker thread to read the next ``depth`` slices along it, so the
+    slice for the next step event is usually already in memory. Requests from
+    an older scroll position are dropped as soon as a newer one arrives.
+    """
+
+    def __init__(self, engine, capacity=CACHE_SLICES, depth=PREFETCH_DEPTH):
+        self.engine = engine
+        self.capacity = capacity
+        self.depth = depth
+        self.slices = OrderedDict()  # {(view, index): slice}
+        self.lock = threading.Lock()
+        self.last = {}  # {view: (index, time)} of the previous request
+        self.pending = None  # (view, [indices]) waiting for the worker
+        self.wakeup = threading.Condition(self.lock)
+        self.stopped = False
+        self.worker = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self.worker.start()
+
+    def get(self, view, index):
+        key = (view, index)
+        with self.lock:
+            data = self.slices.get(key)
+            if data is not None:
+                self.slices.move_to_end(key)
+        if data is None:
+            data = self.engine.read(view, index)
+            self._store(key, data)
+        self._predict(view, index)
+        return data
+
+    def _store(self, key, data):
+        with self.lock:
+            self.slices[key] = data
+            self.slices.move_to_end(key)
+            while len(self.slices) > self.capacity:
+                self.slices.popitem(last=False)
+
+    def _predict(self, view, index):
+        """Queue the slices the user will most likely ask for next"""
+        now = time.perf_counter()
+        previous = self.last.get(view)
+        self.last[view] = (index, now)
+        if previous is None or previous[0] == index:
+            return
+        # keep the stride of the last move, e.g. wheel scrolling that skips slices
+        step = index - previous[0]
+        # fast drags (short intervals) read further ahead
+        depth = self.depth * 2 if now - previous[1] < 0.05 else self.depth
+        count = self.engine.slice_count(view)
+        indices = [index + step * k for k in range(1, depth + 1)]
+        indices = [i for i in indices if 0 <= i < count]
+        with self.lock:
+            self.pending = (view, indices)
+            self.wakeup.notify()
+
+    def _prefetch_loop(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.stopped:
+                    self.wakeup.wait()
+                if self.stopped:
+                    return
+                view, indices = self.pending
+                self.pending = None
+            for index in indices:
+                with self.lock:
+                    if self.pending is not None or self.stopped:
+                        break  # the user moved on, follow the newer request
+                    cached = (view, index) in self.slices
+                if not cached:
+                    self._store((view, index), self.engine.read(view, index))
+
+    def close(self):
+        with self.lock:
+            self.stopped = True
+            self.slices.clear()
+            self.wakeup.notify()
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+MESH_FACTOR = 2  # block-average the volume by this factor before marching cubes
+MAX_TRIANGLES = 300000  # decimate until the mesh has at most this many faces
+
+# iso levels as percentiles of the foreground intensity statistics (utils.intensity);
+# on T2 the CSF is the brightest structure, vertebral bodies sit around the median
+SURFACE_PERCENTILES = {
+    'CSF': '98',
+    'Bone': '50',
+}
+
+
+def decimate(vertices, faces, max_faces=MAX_TRIANGLES):
+    """Reduce a triangle mesh by vertex clustering.
+
+    Vertices are snapped to a cubic grid and every occupied cell becomes one
+    vertex at the mean position of its members; faces that collapse or become
+    duplicates are dropped. The cell size doubles until at most ``max_faces``
+    faces remain. Cheap and fully vectorized, which matters more here than
+    the optimal shape preservation of quadric-error decimation.
+    """
+    cell = 1.0
+    while len(faces) > max_faces:
+        keys = np.floor(vertices / cell).astype(np.int64)
+        _, cluster, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        cluster = cluster.ravel()
+        merged = np.zeros((len(counts), 3))
+        np.add.at(merged, cluster, vertices)
+        merged /= counts[:, None]
+        faces = cluster[faces]
+        keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+        faces = faces[keep]
+        _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+        faces = faces[np.sort(first)]
+        vertices = merged
+        cell *= 2
+    return vertices.astype(np.float32), faces.astype(np.int32)
+
+
+def extract_surface(volume, threshold, factor=MESH_FACTOR, max_faces=MAX_TRIANGLES):
+    """Marching-cubes iso-surface of a (z, y, x) volume in full-resolution voxel coordinates"""
+    from skimage.measure import marching_cubes
+    from napari_nifti._pyramid import downsample
+
+    grid = downsample(volume, factor) if factor > 1 else np.asarray(volume)
+    grid = np.asarray(grid, dtype=np.float32)
+    if not grid.min() < threshold < grid.max():
+        raise ValueError(f"Threshold {threshold:g} is outside the intensity range of the volume")
+    vertices, faces, _, _ = marching_cubes(grid, level=threshold)
+    vertices, faces = decimate(vertices, faces, max_faces)
+    # back to full-resolution voxels, block means sit at the centre of their block
+    return (vertices * factor + (factor - 1) / 2).astype(np.float32), faces
+
+
+def load_surface(volume, threshold, filepath=None, cache=None, factor=MESH_FACTOR, window=None):
+    """Return ``(vertices, faces)`` for a threshold, cached as .npz per file version and threshold
+
+    The threshold is in the units of ``volume``, so the cache key also holds
+    its dtype and, for a display copy quantized by ``quantize_volume``, the
+    ``window`` it was quantized with.
+    """
+    filename = None
+    if cache is not None and filepath:
+        key = f"{threshold:.6g}_{factor}_{np.dtype(volume.dtype).name}"
+        if window is not None:
+            key += f"_{window[0]:.6g}_{window[1]:.6g}"
+        filename = cache.path_for(filepath, f"_surface_{key}.npz")
+        if os.path.exists(filename):
+            try:
+                with np.load(filename) as mesh:
+                    return mesh['vertices'], mesh['faces']
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring broken mesh cache {filename}: {str(e)}")
+    vertices, faces = extract_surface(volume, threshold, factor)
+    if filename is not None:
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename + '.tmp', 'wb') as f:
+                np.savez(f, vertices=vertices, faces=faces)
+            os.replace(filename + '.tmp', filename)
+        except OSError as e:
+            print(f"Could not cache mesh of {filepath}: {str(e)}")
+    return vertices, faces
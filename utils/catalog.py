@@ -0,0 +1,128 @@
+import os
+import re
+import sqlite3
+import threading
+
+import nibabel as nib
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'nifti_catalog.sqlite')
+
+COLUMNS = ('shape', 'voxel_size', 'orientation', 'dtype', 'sequence')
+
+# e.g. "T2G003_Spine_MRI_t2_space_sag_p2_iso_20250122160508_5001" or
+# "T2G002_MRI_Spine_t2_space_sag_p2_iso_20240820161941_19001" -> "t2_space_sag_p2_iso";
+# exports also carry 13 digit acquisition times ("..._2050122160508_5001")
+SEQUENCE_PATTERN = re.compile(r'(?:^|_)MRI_(?:Spine_)?(?P<sequence>.+?)_\d{13,14}_\d+$', re.IGNORECASE)
+
+
+def parse_sequence_name(filename):
+    """Guess the acquisition sequence from a file name"""
+    stem = os.path.basename(filename)
+    for ext in ('.nii.gz', '.nii'):
+        if stem.lower().endswith(ext):
+            stem = stem[:-len(ext)]
+            break
+    match = SEQUENCE_PATTERN.search(stem)
+    if match:
+        return match.group('sequence')
+    # BIDS style names such as "sub-01_ses-01_T2w" keep the sequence in the last part
+    return stem.split('_')[-1]
+
+
+def read_header_metadata(path):
+    """Read shape, voxel size, orientation and dtype from the header only (no voxel data)"""
+    img = nib.load(path)
+    header = img.header
+    return {
+        'shape': 'x'.join(str(s) for s in header.get_data_shape()),
+        'voxel_size': 'x'.join(f"{z:.2f}" for z in header.get_zooms()[:3]),
+        'orientation': ''.join(nib.orientations.aff2axcodes(img.affine)),
+        'dtype': str(header.get_data_dtype()),
+        'sequence': parse_sequence_name(path),
+    }
+
+
+class NiftiCatalog:
+    """Persistent SQLite catalog of header-only NIfTI metadata, invalidated by file mtime"""
+
+    def __init__(self, db_path=DEFAULT_CATALOG_PATH):
+        self.db_path = os.path.abspath(db_path)
+        self.lock = threading.Lock()
+        # shared between the GUI thread and the catalog worker, access is serialized by self.lock
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, "
+                "shape TEXT, voxel_size TEXT, orientation TEXT, dtype TEXT, sequence TEXT)"
+            )
+
+    def get(self, path, stat=None):
+        """Return the cached metadata of a file, or None if missing or outdated (``stat`` saves a stat call)"""
+        if stat is None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT mtime, size, {', '.join(COLUMNS)} FROM files WHERE path = ?",
+                (os.path.abspath(path),)
+            ).fetchone()
+        if row is None or row[0] != stat.st_mtime or row[1] != stat.st_size:
+            return None
+        return dict(zip(COLUMNS, row[2:]))
+
+    def update(self, path):
+        """Read the header of a file and store it in the catalog"""
+        stat = os.stat(path)
+        info = read_header_metadata(path)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO files (path, mtime, size, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(COLUMNS))})",
+                (os.path.abspath(path), stat.st_mtime, stat.st_size) + tuple(info[c] for c in COLUMNS)
+            )
+        return info
+
+    def lookup(self, path):
+        """Return the metadata of a file, reading its header only if the catalog is outdated"""
+        return self.get(path) or self.update(path)
+
+    def remove(self, path):
+        """Drop a file from the catalog"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CatalogWorker(threading.Thread):
+    """Background thread that fills the catalog for files it has not seen yet.
+
+    Each result is put on ``result_queue`` as ``(path, metadata)`` so a GUI can
+    pick it up on its own thread.
+    """
+
+    def __init__(self, catalog, paths, result_queue):
+        super().__init__(daemon=True)
+        self.catalog = catalog
+        self.paths = list(paths)
+        self.result_queue = result_queue
+        self.stopped = threading.Event()
+
+    def run(self):
+        for path in self.paths:
+            if self.stopped.is_set():
+                break
+            try:
+                info = self.catalog.get(path) or self.catalog.update(path)
+            except Exception as e:
+                print(f"Catalog error for {path}: {str(e)}")
+                continue
+            self.result_queue.put((path, info))
+
+    def stop(self):
+        self.stopped.set()
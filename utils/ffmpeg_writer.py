@@ -0,0 +1,175 @@
+import functools
+import re
+import subprocess
+
+import numpy as np
+
+# ffmpeg output options per preset and the container they are written to
+ENCODER_PRESETS = {
+    # live capture: cheapest H.264 settings, quality held by CRF instead of a bitrate
+    'live': {
+        'extension': '.mp4',
+        'filters': ['pad=ceil(iw/2)*2:ceil(ih/2)*2'],
+        'args': ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23', '-pix_fmt', 'yuv420p'],
+    },
+    # archival: lossless FFV1 in Matroska, no chroma subsampling
+    'archival': {
+        'extension': '.mkv',
+        'filters': [],
+        'args': ['-c:v', 'ffv1', '-level', '3', '-g', '1', '-slices', '4', '-pix_fmt', 'bgr0'],
+    },
+    # proxy: half resolution for quick review and sharing
+    'proxy': {
+        'extension': '.mp4',
+        'filters': ['scale=trunc(iw/4)*2:trunc(ih/4)*2'],
+        'args': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28', '-pix_fmt', 'yuv420p'],
+    },
+}
+
+# Matroska element IDs of the stream piped to ffmpeg
+MKV_EBML = 0x1A45DFA3
+MKV_EBML_VERSION = 0x4286
+MKV_EBML_READ_VERSION = 0x42F7
+MKV_DOC_TYPE = 0x4282
+MKV_DOC_TYPE_VERSION = 0x4287
+MKV_DOC_TYPE_READ_VERSION = 0x4285
+MKV_SEGMENT = 0x18538067
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_UID = 0x73C5
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_DEFAULT_DURATION = 0x23E383
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_COLOUR_SPACE = 0x2EB524
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMESTAMP = 0xE7
+MKV_SIMPLE_BLOCK = 0xA3
+MKV_UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'  # size of the open-ended segment and clusters
+MKV_CLUSTER_SPAN = 32767  # ms, block timestamps are signed 16-bit offsets from their cluster's
+
+
+def get_ffmpeg_exe():
+    """ffmpeg binary shipped with imageio-ffmpeg, or the one on PATH"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return 'ffmpeg'
+
+
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_version(exe):
+    """(major, minor) version of an ffmpeg binary, None for git builds or when it does not run"""
+    try:
+        output = subprocess.run([exe, '-version'], capture_output=True, text=True).stdout
+    except OSError:
+        return None
+    match = re.match(r'ffmpeg version n?(\d+)\.(\d+)', output)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def fps_mode_args(exe, mode):
+    """Output option for the frame timing ``mode``; ``-fps_mode`` replaced ``-vsync`` in ffmpeg 5.1"""
+    version = get_ffmpeg_version(exe)
+    if version is not None and version < (5, 1):
+        return ['-vsync', mode]
+    return ['-fps_mode', mode]
+
+
+def _ebml_size(size):
+    """EBML variable-length integer of an element size"""
+    length = 1
+    while size >= (1 << (7 * length)) - 1:  # all value bits set means "unknown size"
+        length += 1
+    return ((1 << (7 * length)) | size).to_bytes(length, 'big')
+
+
+def _ebml(element_id, value):
+    """EBML element holding an unsigned integer, an ASCII string or bytes (e.g. nested elements)"""
+    if isinstance(value, int):
+        value = value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big')
+    elif isinstance(value, str):
+        value = value.encode('ascii')
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + _ebml_size(len(value)) + value
+
+
+class FFmpegPipeWriter:
+    """Stream raw BGRA (or RGBA) frames with their timestamps into a persistent ffmpeg process.
+
+    Frames go to ffmpeg's stdin as they are (no NumPy copies, no RGB
+    conversion in Python), each in a block of a minimal uncompressed
+    Matroska stream that carries its presentation time; ffmpeg converts the
+    colour space in its own threads. A frame is shown until the next one, so
+    a static screen is sent once: at a constant frame rate ffmpeg's fps
+    filter repeats it, with ``variable_frame_rate`` the output keeps the
+    input timestamps. Frames must all have the size given at construction;
+    smaller or larger ones (e.g. after a window resize) are padded or
+    cropped to it.
+    """
+
+    def __init__(self, path, width, height, fps, preset='live', pix_fmt='bgra', variable_frame_rate=False):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = 0
+        self.last_ms = -1  # timestamp of the last frame
+        self.cluster_ms = None  # timestamp of the open cluster
+        exe = get_ffmpeg_exe()
+        filters = ENCODER_PRESETS[preset]['filters']
+        if variable_frame_rate:
+            timing = fps_mode_args(exe, 'vfr')
+        else:
+            # the fps filter repeats frames up to the next timestamp and holds the last one for 1 / fps
+            filters = [f'fps={fps}'] + filters
+            timing = fps_mode_args(exe, 'passthrough')
+        command = [exe, '-y', '-loglevel', 'error', '-f', 'matroska', '-i', '-']
+        if filters:
+            command += ['-vf', ','.join(filters)]
+        command += ENCODER_PRESETS[preset]['args'] + timing + [path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        track = (_ebml(MKV_TRACK_NUMBER, 1) + _ebml(MKV_TRACK_UID, 1) + _ebml(MKV_TRACK_TYPE, 1)
+                 + _ebml(MKV_CODEC_ID, 'V_UNCOMPRESSED')
+                 + _ebml(MKV_DEFAULT_DURATION, int(round(1e9 / fps)))  # ns, the duration of the last frame
+                 + _ebml(MKV_VIDEO, _ebml(MKV_PIXEL_WIDTH, width) + _ebml(MKV_PIXEL_HEIGHT, height)
+                         + _ebml(MKV_COLOUR_SPACE, pix_fmt.upper().encode('ascii'))))
+        self.process.stdin.write(
+            _ebml(MKV_EBML, _ebml(MKV_EBML_VERSION, 1) + _ebml(MKV_EBML_READ_VERSION, 1)
+                  + _ebml(MKV_DOC_TYPE, 'matroska') + _ebml(MKV_DOC_TYPE_VERSION, 4)
+                  + _ebml(MKV_DOC_TYPE_READ_VERSION, 2))
+            + MKV_SEGMENT.to_bytes(4, 'big') + MKV_UNKNOWN_SIZE
+            + _ebml(MKV_TRACKS, _ebml(MKV_TRACK_ENTRY, track)))
+
+    def append_data(self, frame, pts=None):
+        """Write one (height, width, 4) uint8 frame in the writer's pixel format, shown from ``pts`` seconds on
+
+        Without ``pts`` the frame follows the previous one after 1 / fps.
+        """
+        if frame.shape[:2] != (self.height, self.width):
+            fitted = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+            h, w = min(self.height, frame.shape[0]), min(self.width, frame.shape[1])
+            fitted[:h, :w] = frame[:h, :w]
+            frame = fitted
+        if pts is None:
+            pts = self.frames / self.fps
+        # millisecond timestamps, strictly increasing
+        ms = max(int(round(pts * 1000)), self.last_ms + 1)
+        if self.cluster_ms is None or ms - self.cluster_ms > MKV_CLUSTER_SPAN:
+            self.cluster_ms = ms
+            self.process.stdin.write(MKV_CLUSTER.to_bytes(4, 'big') + MKV_UNKNOWN_SIZE + _ebml(MKV_TIMESTAMP, ms))
+        data = memoryview(np.ascontiguousarray(frame)).cast('B')
+        # block header: track 1, timestamp relative to the cluster, keyframe flag; then the pixels as they are
+        self.process.stdin.write(bytes([MKV_SIMPLE_BLOCK]) + _ebml_size(len(data) + 4) + b'\x81'
+                                 + (ms - self.cluster_ms).to_bytes(2, 'big', signed=True) + b'\x80')
+        self.process.stdin.write(data)
+        self.frames += 1
+        self.last_ms = ms
+
+    def close(self):
+        if self.process.stdin:
+            self.process.stdin.close()
+        if self.process.wait() != 0:
+            print(f"ffmpeg exited with code {self.process.returncode}")
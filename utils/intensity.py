@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_STATS_DIR = os.path.join(os.path.dirname(__file__), '..', 'intensity_cache')
+
+HISTOGRAM_BINS = 1024
+SLAB = 16  # slices reduced at once, keeps memory bounded for lazy volumes
+PERCENTILES = (0.5, 1, 2, 5, 50, 95, 98, 99, 99.5)
+
+# display windows as (low, high) percentiles of the foreground intensities;
+# T1 keeps fat/marrow from clipping, T2 leaves headroom for bright CSF
+WINDOW_PRESETS = {
+    'T1': (0.5, 99.5),
+    'T2': (1, 99),
+}
+DEFAULT_PRESET = 'T2'
+
+_memory_cache = {}  # {cache key: statistics}, shared by all viewers of this process
+_memory_lock = threading.Lock()
+
+
+def slab_size(volume, default=SLAB):
+    """Slices to read at once: one chunk row for chunked (dask) volumes, so each chunk is read once"""
+    chunks = getattr(volume, 'chunksize', None)
+    return chunks[0] if chunks else default
+
+
+def _slabs(volume):
+    """Yield the volume as float32 blocks along its first axis"""
+    slab = slab_size(volume)
+    for start in range(0, volume.shape[0], slab):
+        yield np.asarray(volume[start:start + slab], dtype=np.float32)
+
+
+def percentile_from_histogram(counts, edges, q):
+    """Return the q-th percentile (0-100) of a histogram, interpolating inside the bin"""
+    total = counts.sum()
+    if total == 0:
+        return float(edges[0])
+    cumulative = np.cumsum(counts)
+    target = total * q / 100.0
+    i = int(np.searchsorted(cumulative, target))
+    i = min(i, len(counts) - 1)
+    below = cumulative[i - 1] if i > 0 else 0
+    fraction = (target - below) / counts[i] if counts[i] else 0.0
+    return float(edges[i] + fraction * (edges[i + 1] - edges[i]))
+
+
+def compute_intensity_statistics(volume, bins=HISTOGRAM_BINS):
+    """Stream over a volume once for its range and once for a histogram.
+
+    Works slab by slab on anything that supports slicing along the first
+    axis (ndarray, memmap, nibabel ``dataobj``, ``LazyNiftiArray``). For
+    non-negative data (MRI magnitude) the zero background is counted
+    separately and left out of the percentiles, otherwise it would pull
+    every window down to the air intensity.
+    """
+    vmin, vmax = np.inf, -np.inf
+    for block in _slabs(volume):
+        finite = block[np.isfinite(block)]
+        if finite.size:
+            vmin = min(vmin, float(finite.min()))
+            vmax = max(vmax, float(finite.max()))
+    if not np.isfinite(vmin):
+        vmin, vmax = 0.0, 0.0
+    skip_zero = vmin >= 0
+    upper = vmax if vmax > vmin else vmin + 1.0
+    counts = np.zeros(bins, dtype=np.int64)
+    zeros = 0
+    for block in _slabs(volume):
+        values = block[np.isfinite(block)]
+        if skip_zero:
+            zeros += int(np.count_nonzero(values == 0))
+            values = values[values != 0]
+        counts += np.histogram(values, bins=bins, range=(vmin, upper))[0]
+    edges = np.linspace(vmin, upper, bins + 1)
+    if counts.sum() == 0:
+        # constant (e.g. empty) volume: fall back to the full range
+        percentiles = {str(q): vmin for q in PERCENTILES}
+        windows = {name: [vmin, upper] for name in WINDOW_PRESETS}
+    else:
+        percentiles = {str(q): percentile_from_histogram(counts, edges, q) for q in PERCENTILES}
+        windows = {}
+        for name, (low, high) in WINDOW_PRESETS.items():
+            lo = percentile_from_histogram(counts, edges, low)
+            hi = percentile_from_histogram(counts, edges, high)
+            windows[name] = [lo, hi if hi > lo else lo + 1.0]
+    return {
+        'min': vmin,
+        'max': vmax,
+        'histogram': counts.tolist(),
+        'bin_edges': [vmin, upper],
+        'background_voxels': zeros,
+        'percentiles': percentiles,
+        'windows': windows,
+    }
+
+
+def _cache_key(path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return hashlib.sha1(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8')).hexdigest()[:24]
+
+
+def load_intensity_statistics(path, volume=None, cache_dir=DEFAULT_STATS_DIR):
+    """Return the intensity statistics of a file, computing and caching them on first use.
+
+    Results are kept in memory and as JSON in ``cache_dir``, keyed by the
+    absolute path, modification time and size of the file. ``volume`` is the
+    already opened data; if omitted the file is read with nibabel, lazily
+    unless it is gzip compressed: every read through the proxy of a .nii.gz
+    inflates the stream from the start, so it is decoded once instead.
+    """
+    key = _cache_key(path)
+    with _memory_lock:
+        stats = _memory_cache.get(key)
+    if stats is not None:
+        return stats
+    cache_file = os.path.join(cache_dir, key + '.json')
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = None
+    if stats is None:
+        if volume is None:
+            import nibabel as nib
+            volume = nib.load(path).dataobj
+            if path.endswith('.gz'):
+                volume = np.asanyarray(volume)
+        stats = compute_intensity_statistics(volume)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_file + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(stats, f)
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError as e:
+            print(f"Could not cache intensity statistics of {path}: {str(e)}")
+    with _memory_lock:
+        _memory_cache[key] = stats
+    return stats
+
+
+def preset_for(path):
+    """Pick the window preset matching the sequence in a file name"""
+    name = os.path.basename(path).lower()
+    for preset in WINDOW_PRESETS:
+        if preset.lower() in name:
+            return preset
+    return DEFAULT_PRESET
+
+
+def display_window(path, volume=None, preset=None):
+    """Return the cached ``(low, high)`` display window of a file"""
+    stats = load_intensity_statistics(path, volume)
+    low, high = stats['windows'][preset or preset_for(path)]
+    return float(low), float(high)
+
+
+def quantize_volume(volume, window, dtype=np.uint8, out=None):
+    """Return a display copy of a volume, slab by slab.
+
+    For ``uint8`` the window is applied once, mapping ``window`` to 0..255, so
+    the copy needs a quarter of float32 memory and displays with contrast
+    limits ``(0, 255)``. ``float16`` keeps the original values (halving
+    float32 memory) and is shown with the original window. ``out`` may be a
+    preallocated (e.g. memory-mapped) array of the volume's shape.
+    """
+    dtype = np.dtype(dtype)
+    if out is None:
+        out = np.empty(volume.shape, dtype=dtype)
+    low, high = window
+    slab = slab_size(volume)
+    for start in range(0, volume.shape[0], slab):
+        block = np.asarray(volume[start:start + slab], dtype=np.float32)
+        if dtype == np.uint8:
+            block = np.clip((block - low) * (255.0 / (high - low)), 0, 255) + 0.5
+        out[start:start + slab] = block
+    return out
+
+
+def display_limits(window, dtype):
+    """Contrast limits of a display copy made by ``quantize_volume``"""
+    return (0.0, 255.0) if np.dtype(dtype) == np.uint8 else window
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # fall back to polling directory mtimes
+    FileSystemEventHandler = object
+    Observer = None
+
+NIFTI_SUFFIX = '.nii.gz'
+BATCH_SIZE = 200
+POLL_INTERVAL = 2.0  # seconds between directory checks when watchdog is not installed
+SETTLE_TIME = 1.0  # seconds without writes before a modified file is re-read
+
+
+class _NiftiEventHandler(FileSystemEventHandler):
+    """Translate watchdog events into scanner deltas"""
+
+    def __init__(self, scanner):
+        super().__init__()
+        self.scanner = scanner
+
+    def on_created(self, event):
+        if event.is_directory:
+            self.scanner._emit(list(self.scanner._walk(event.src_path)))
+        elif event.src_path.lower().endswith(NIFTI_SUFFIX):
+            self.scanner._emit([self.scanner._add_event(event.src_path)])
+            self.scanner._touch(event.src_path)  # still being written, size and header follow
+
+    def on_modified(self, event):
+        if not event.is_directory and event.src_path.lower().endswith(NIFTI_SUFFIX):
+            self.scanner._touch(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory or event.src_path.lower().endswith(NIFTI_SUFFIX):
+            self.scanner._emit([('remove', event.src_path, None, None)])
+
+    def on_moved(self, event):
+        self.on_deleted(event)
+        if event.is_directory:
+            self.scanner._emit(list(self.scanner._walk(event.dest_path)))
+        elif event.dest_path.lower().endswith(NIFTI_SUFFIX):
+            self.scanner._emit([self.scanner._add_event(event.dest_path)])
+            self.scanner._touch(event.dest_path)
+
+
+class DirectoryScanner(threading.Thread):
+    """Background scanner that streams NIfTI files of a directory tree to a queue.
+
+    The first pass walks the tree with ``os.scandir`` and puts lists of up to
+    ``BATCH_SIZE`` events on ``result_queue``. Afterwards the tree is watched
+    and only deltas are reported: with watchdog (inotify & co.) if it is
+    installed, otherwise by re-listing just the directories whose mtime
+    changed. Events are ``('add', path, size, info)``, ``('update', path,
+    size, info)`` once a file that was created or rewritten has had no
+    writes for ``SETTLE_TIME``, ``('remove', path, None, None)`` (path may be
+    a directory) and ``('done', root, None, None)`` after the first pass.
+    ``info`` is the metadata from ``catalog`` if it is
+    up to date (looked up here with the stat result of the scan, so the GUI
+    thread never touches the disk or the database), otherwise None.
+    """
+
+    def __init__(self, root, result_queue, watch=True, catalog=None):
+        super().__init__(daemon=True)
+        self.root = os.path.abspath(root)
+        self.result_queue = result_queue
+        self.watch = watch
+        self.catalog = catalog
+        self.stopped = threading.Event()
+        self.dir_mtimes = {}  # {directory: mtime} for the polling fallback
+        self.dir_entries = {}  # {directory: (set of nifti files, set of subdirectories)}
+        self.lock = threading.Lock()
+        self.written = {}  # {path: (time of the last write, stat key)} of files that may still be written
+
+    def run(self):
+        batch = []
+        for event in self._walk(self.root):
+            if self.stopped.is_set():
+                return
+            batch.append(event)
+            if len(batch) >= BATCH_SIZE:
+                self._emit(batch)
+                batch = []
+        self._emit(batch + [('done', self.root, None, None)])
+        if not self.watch:
+            return
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(_NiftiEventHandler(self), self.root, recursive=True)
+            observer.start()
+            while not self.stopped.wait(SETTLE_TIME / 2):
+                self._emit(self._settled())
+            observer.stop()
+            observer.join()
+        else:
+            while not self.stopped.wait(POLL_INTERVAL):
+                self._poll()
+                # in-place writes do not change the directory mtime, files are re-checked until they settle
+                with self.lock:
+                    recent = list(self.written)
+                for path in recent:
+                    self._touch(path)
+                self._emit(self._settled())
+
+    def stop(self):
+        self.stopped.set()
+
+    def _emit(self, events):
+        if events:
+            self.result_queue.put(events)
+
+    def _add_event(self, path, stat=None, kind='add'):
+        """'add' (or 'update') event for a file, with its catalog metadata if the catalog is up to date"""
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return (kind, path, 0, None)
+        info = self.catalog.get(path, stat) if self.catalog is not None else None
+        return (kind, path, stat.st_size, info)
+
+    def _touch(self, path):
+        """Note a write to ``path``; the clock restarts only if its size or mtime changed"""
+        try:
+            stat = os.stat(path)
+            key = (stat.st_size, stat.st_mtime)
+        except OSError:
+            key = None
+        with self.lock:
+            last = self.written.get(path)
+            if last is None or last[1] != key:
+                self.written[path] = (time.monotonic(), key)
+
+    def _settled(self):
+        """'update' events of the files without writes for SETTLE_TIME"""
+        now = time.monotonic()
+        with self.lock:
+            settled = [path for path, (written, _) in self.written.items() if now - written >= SETTLE_TIME]
+            for path in settled:
+                del self.written[path]
+        return [self._add_event(path, kind='update') for path in settled if os.path.exists(path)]
+
+    def _list(self, directory):
+        """List one directory, remembering its mtime and contents"""
+        files, subdirs = {}, set()
+        try:
+            self.dir_mtimes[directory] = os.stat(directory).st_mtime
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.path)
+                    elif entry.name.lower().endswith(NIFTI_SUFFIX):
+                        files[entry.path] = entry.stat()
+        except OSError:
+            pass
+        self.dir_entries[directory] = (set(files), subdirs)
+        return files, subdirs
+
+    def _walk(self, directory):
+        """Yield 'add' events for every NIfTI file below ``directory``"""
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            files, subdirs = self._list(current)
+            for path in sorted(files):
+                yield self._add_event(path, files[path])
+            pending.extend(sorted(subdirs, reverse=True))
+
+    def _forget(self, directory):
+        """Drop a removed directory and everything below it from the index"""
+        for known in [d for d in self.dir_entries if d == directory or d.startswith(directory + os.sep)]:
+            self.dir_entries.pop(known, None)
+            self.dir_mtimes.pop(known, None)
+
+    def _poll(self):
+        """Re-list only the directories whose mtime changed and emit the differences"""
+        events = []
+        for directory in list(self.dir_entries):
+            if directory not in self.dir_entries:
+                continue  # removed while handling a parent
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue  # the parent directory reports the removal
+            if mtime == self.dir_mtimes.get(directory):
+                continue
+            old_files, old_subdirs = self.dir_entries[directory]
+            files, subdirs = self._list(directory)
+            for path in sorted(set(files) - old_files):
+                events.append(self._add_event(path, files[path]))
+                self._touch(path)
+            events += [('remove', path, None, None) for path in sorted(old_files - set(files))]
+            for subdir in sorted(old_subdirs - subdirs):
+                self._forget(subdir)
+                events.append(('remove', subdir, None, None))
+            for subdir in sorted(subdirs - old_subdirs):
+                events += list(self._walk(subdir))
+        self._emit(events)
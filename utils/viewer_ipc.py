@@ -0,0 +1,99 @@
+import json
+import socket
+
+VIEWER_HOST = '127.0.0.1'
+VIEWER_PORT = 50731
+
+
+def send_command(command, timeout=2.0, host=VIEWER_HOST, port=VIEWER_PORT):
+    """Send a command dict to a running viewer and return its reply, or None if no viewer is listening.
+
+    Blocks for up to ``timeout`` seconds, call it off the GUI thread. Once
+    connected, a viewer that is busy (e.g. loading a volume) and does not
+    answer in time or drops the connection gives an ``{"ok": false}`` reply,
+    not None: it is running, so starting another one would be wrong.
+    """
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    except OSError:
+        return None  # refused (or unreachable): no viewer
+    try:
+        with sock:
+            sock.sendall((json.dumps(command) + '\n').encode('utf-8'))
+            reply = b''
+            while not reply.endswith(b'\n'):
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                reply += chunk
+    except OSError as e:
+        return {'ok': False, 'error': f"No reply from the viewer: {str(e)}"}
+    try:
+        return json.loads(reply.decode('utf-8'))
+    except ValueError:
+        return {'ok': False, 'error': "Invalid reply from the viewer"}
+
+
+def open_in_viewer(path):
+    """Ask a running viewer to open ``path``.
+
+    Returns the viewer's reply (``reply['ok']`` tells whether it accepted the
+    file), or None if no viewer is running.
+    """
+    return send_command({'cmd': 'open', 'path': path})
+
+
+class ViewerServer:
+    """Local TCP server that lets other processes drive a running viewer.
+
+    Runs inside the Qt event loop, so ``handlers`` are called on the GUI
+    thread. Each request is one JSON line such as
+    ``{"cmd": "open", "path": "..."}``; ``handlers[cmd](request)`` is called
+    and the reply is ``{"ok": true}`` or ``{"ok": false, "error": "..."}``.
+    """
+
+    def __init__(self, handlers, host=VIEWER_HOST, port=VIEWER_PORT):
+        from qtpy.QtNetwork import QHostAddress, QTcpServer
+
+        self.handlers = handlers
+        self.buffers = {}
+        self.server = QTcpServer()
+        self.server.newConnection.connect(self._on_new_connection)
+        self.listening = self.server.listen(QHostAddress(host), port)
+        if not self.listening:
+            print(f"Viewer server not started: {self.server.errorString()}")
+
+    def _on_new_connection(self):
+        while self.server.hasPendingConnections():
+            conn = self.server.nextPendingConnection()
+            self.buffers[conn] = b''
+            conn.readyRead.connect(lambda conn=conn: self._on_ready_read(conn))
+            conn.disconnected.connect(lambda conn=conn: self._on_disconnected(conn))
+
+    def _on_disconnected(self, conn):
+        self.buffers.pop(conn, None)
+        conn.deleteLater()
+
+    def _on_ready_read(self, conn):
+        self.buffers[conn] += bytes(conn.readAll())
+        while b'\n' in self.buffers[conn]:
+            line, self.buffers[conn] = self.buffers[conn].split(b'\n', 1)
+            reply = self._handle(line)
+            conn.write((json.dumps(reply) + '\n').encode('utf-8'))
+            conn.flush()
+
+    def _handle(self, line):
+        try:
+            request = json.loads(line.decode('utf-8'))
+            handler = self.handlers[request['cmd']]
+        except (ValueError, KeyError, TypeError) as e:
+            return {'ok': False, 'error': f"Invalid request: {str(e)}"}
+        try:
+            handler(request)
+        except Exception as e:
+            print(f"Viewer command failed: {str(e)}")
+            return {'ok': False, 'error': str(e)}
+        return {'ok': True}
+
+    def close(self):
+        self.server.close()
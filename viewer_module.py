@@ -1,6 +1,6 @@
-from qtpy.QtCore import Qt
+from qtpy.QtCore import Qt, QTimer
 from qtpy.QtWidgets import (QSlider, QLineEdit, QWidget, QLabel, QVBoxLayout, QHBoxLayout,
-                           QPushButton, QSizePolicy)
+                           QPushButton, QSizePolicy, QComboBox, QDoubleSpinBox)
 from qtpy.QtWidgets import QInputDialog
 from qtpy.QtWidgets import QListWidgetItem 
 import numpy as np
@@ -16,18 +16,51 @@ import time
 from scipy.io.wavfile import write
 from utils.transcribe import transcribe_audio  
 from utils.llm import generate_napari_code 
+from slice_engine import SliceEngine, SlabProjector, VIEW_AXES, DISPLAY_AXES
+from utils.intensity import display_window, display_limits, quantize_volume, load_intensity_statistics
+from surface_mesh import SURFACE_PERCENTILES
+from cpr import CurvedPlanarReformation, estimate_centreline
+from linked_series import LinkedSeries
+from preview_3d import Preview3D
+from session_log import portable_path, resolve_path
+from napari_nifti._reader import napari_get_reader
 import re
 import textwrap
 
 class ViewerUI:
-    def __init__(self, image_array, metadata, filepath, recorder, RECORD_PATH, visible_views=['sagittal', 'axial']):
+    def __init__(self, image_array, metadata, filepath, recorder, RECORD_PATH, visible_views=['sagittal', 'axial', 'coronal'], volume_cache=None, display_dtype=None):
         self.viewer = Viewer()
-        self.image_array = image_array
         self.metadata = metadata
+        self.volume_cache = volume_cache
+        # low-memory mode: show a windowed uint8 (or float16) copy and release the original
+        self.display_dtype = display_dtype
+        # fixed per-volume window, so napari never reduces the data and slices share one brightness
+        self.image_array, self.contrast_limits = self._prepare_volume(image_array, filepath)
+        # display-oriented slices, from per-view stacks built in the background for cached volumes
+        self.slice_engine = SliceEngine(self.image_array, views=visible_views, cache=volume_cache, path=filepath)
+        # thick-slab projection state, None means single slices
+        self.slab_mode = None
+        self.slab_thickness_mm = 10.0
+        self.slab_projectors = {}
+        # curved planar reformation, created on demand
+        self.cpr = None
+        self.cpr_points_layer = None
+        self.cpr_layer = None
+        self.cpr_offset_mm = 0.0  # left-right shift of the curved surface
+        # other series of the study shown with a linked cursor: [(LinkedSeries, {view: layer})]
+        self.linked_series = []
+        self.linked_sources = []  # (filepath, colormap) of each linked series
+        # in-process 3D view sharing the loaded volume
+        self.preview_3d = None
+        self.filepath = filepath
         self.RECORD_PATH = RECORD_PATH
         self.recorder = recorder
+        if recorder is not None:
+            # the session log starts with the state kept outside the napari layers
+            recorder.ui_state = self.session_state
         self.visible_views = visible_views
         self.translate_offset = None
+        self.base_scale = None
         self.sagittal_base_scale = None
         self.axial_base_scale = None
         self.apply_layout_settings()
@@ -61,7 +94,7 @@ class ViewerUI:
         layout.addWidget(self.file_name_label)
 
         # add layer information
-        self.corner_label = QLabel("D => open 3D image\n M => add new annotation\nC => open annotation list")
+        self.corner_label = QLabel("D => open 3D image\n M => add new annotation\nC => open annotation list\nV => curved reformation")
         self.corner_label.setWordWrap(True)
         self.corner_label.setStyleSheet("color: black; background-color: #f0f0f0; padding: 5px; border-radius: 3px;")
         self.corner_label.setAlignment(Qt.AlignCenter)
@@ -143,9 +176,10 @@ class ViewerUI:
         print(f'window_width={window_width}, window_height={window_height}')
 
         # Calculate base scaling ratio (maintain aspect ratio)
+        n_views = max(len(self.visible_views), 2)
         if layout_setting == 'vertical':
             # Vertical layout: stacked vertically, same width
-            viewport_height = window_height // 2
+            viewport_height = window_height // n_views
             viewport_width = window_width
             
             # Sagittal plane scaling calculation (display X-Y plane)
@@ -159,22 +193,27 @@ class ViewerUI:
             axial_scale_y = viewport_height / y
             axial_scale = min(axial_scale_x, axial_scale_y)
             print(f'axial_scale={axial_scale}')
+
+            # Coronal plane scaling calculation (display Z-X plane)
+            coronal_scale = min(viewport_width / x, viewport_height / z)
             
             # Use minimum scaling to ensure display
             final_scale = min(sagittal_scale, axial_scale)
+            if 'coronal' in self.visible_views:
+                final_scale = min(final_scale, coronal_scale)
             print(f'final_scale={final_scale}')
-            self.sagittal_base_scale = (final_scale, final_scale, final_scale)
-            self.axial_base_scale = (final_scale, final_scale, final_scale)
             
             # Auto calculate offset (vertical layout)
             self.translate_offset = {
                 'sagittal': (x * final_scale / 2, -y * final_scale / 2 - 200),
-                'axial': (-y * final_scale / 2, -y * final_scale / 2 - 200)
+                'axial': (-y * final_scale / 2, -y * final_scale / 2 - 200),
+                # stacked above the axial view
+                'coronal': (-y * final_scale / 2 - z * final_scale - 20, -y * final_scale / 2 - 200),
             }
             
         elif layout_setting == 'horizontal':  # Horizontal layout
             # Horizontal layout: side by side, same height
-            viewport_width = window_width // 2
+            viewport_width = window_width // n_views
             viewport_height = window_height
             
             # Sagittal plane scaling calculation
@@ -187,23 +226,32 @@ class ViewerUI:
             axial_scale_y = viewport_height / y
             axial_scale = min(axial_scale_x, axial_scale_y)
             print(f'axial_scale={axial_scale}')
+            # Coronal plane scaling calculation
+            coronal_scale = min(viewport_width / x, viewport_height / z)
             
             final_scale = min(sagittal_scale, axial_scale)/2
+            if 'coronal' in self.visible_views:
+                final_scale = min(final_scale, coronal_scale / 2)
             print(f'final_scale={final_scale}')
-            self.sagittal_base_scale = (final_scale, final_scale, final_scale)
-            self.axial_base_scale = (final_scale, final_scale, final_scale)
             
             # Horizontal layout offset calculation
             self.translate_offset = {
                 'sagittal': (-x * sagittal_scale / 2 - 70, -50),
-                'axial': (-x * axial_scale / 2 - 70, -100)
+                'axial': (-x * axial_scale / 2 - 70, -100),
+                # right of the wider of the two other views
+                'coronal': (-x * sagittal_scale / 2 - 70, max(-50 + y * final_scale, -100 + x * final_scale) + 20),
             }
 
-        for view in ['sagittal', 'axial']:
+        # one cached 2D transform per plane
+        self.base_scale = {view: (final_scale, final_scale, final_scale) for view in VIEW_AXES}
+        self.sagittal_base_scale = self.base_scale['sagittal']
+        self.axial_base_scale = self.base_scale['axial']
+
+        for view in self.visible_views:
             layer = getattr(self, f'{view}_layer', None)
             if layer:
                 # Use 2D scaling and translation (ignore Z axis)
-                layer.scale = self.sagittal_base_scale[1:] if view == 'sagittal' else self.axial_base_scale[1:]
+                layer.scale = self.base_scale[view][1:]
                 layer.translate = self.translate_offset[view]
 
 
@@ -268,6 +316,7 @@ class ViewerUI:
         
         # Add slider layout to main layout
         main_layout.addLayout(slider_layout)  # This is the key layout structure from original tmp.py
+        main_layout.addWidget(self._create_slab_controls())
         self.slider_container.setLayout(main_layout)  # Set container layout
 
         # Set stylesheet
@@ -294,7 +343,7 @@ class ViewerUI:
             current_step = list(self.viewer.dims.current_step)
             current_step[dim_index] = value
             self.viewer.dims.current_step = tuple(current_step)
-            label.setText(f"{axis.upper()}: {value}/{max_value}")
+            label.setText(f"{axis.upper()}: {value}/{slider.maximum()}")
         
         slider.valueChanged.connect(update_value)
         layout.addWidget(slider)
@@ -306,6 +355,118 @@ class ViewerUI:
         setattr(self, f'{axis}_label', label)
         return container
 
+    def _create_slab_controls(self):
+        """Create the thick-slab projection mode and thickness controls, and the CPR offset"""
+        container = QWidget()
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.slab_mode_box = QComboBox()
+        for text, mode in (("Single slice", None), ("MIP", 'max'), ("MinIP", 'min'), ("Mean", 'mean')):
+            self.slab_mode_box.addItem(text, mode)
+        self.slab_thickness_box = QDoubleSpinBox()
+        self.slab_thickness_box.setRange(0.5, 200.0)
+        self.slab_thickness_box.setSingleStep(1.0)
+        self.slab_thickness_box.setSuffix(" mm")
+        self.slab_thickness_box.setValue(self.slab_thickness_mm)
+        self.slab_mode_box.currentIndexChanged.connect(self._on_slab_changed)
+        self.slab_thickness_box.valueChanged.connect(self._on_slab_changed)
+        layout.addWidget(QLabel("Slab:"))
+        layout.addWidget(self.slab_mode_box)
+        layout.addWidget(self.slab_thickness_box)
+        # moves the curved reformation (V) left or right of the centreline
+        self.cpr_offset_box = QDoubleSpinBox()
+        self.cpr_offset_box.setRange(-50.0, 50.0)
+        self.cpr_offset_box.setSingleStep(1.0)
+        self.cpr_offset_box.setSuffix(" mm")
+        self.cpr_offset_box.setValue(self.cpr_offset_mm)
+        self.cpr_offset_box.valueChanged.connect(self._on_cpr_offset_changed)
+        layout.addWidget(QLabel("CPR offset:"))
+        layout.addWidget(self.cpr_offset_box)
+        container.setLayout(layout)
+        return container
+
+    def _on_slab_changed(self, *args):
+        self.slab_mode = self.slab_mode_box.currentData()
+        self.slab_thickness_mm = self.slab_thickness_box.value()
+        self._build_slab_projectors()
+        self._update_slices(None)
+        self._log_session_state()
+
+    def session_state(self):
+        """Display state kept outside the napari layers, for the session log"""
+        return {
+            'slab_mode': self.slab_mode,
+            'slab_thickness_mm': self.slab_thickness_mm,
+            # control points in the coordinates of the CPR Centreline layer, None while the CPR is closed
+            'cpr_points': np.asarray(self.cpr_points_layer.data) if self.cpr_points_layer is not None else None,
+            'cpr_offset_mm': self.cpr_offset_mm,
+            'linked_series': [{'path': portable_path(path), 'colormap': colormap}
+                              for path, colormap in self.linked_sources],
+        }
+
+    def apply_session_state(self, state):
+        """Restore a state returned by ``session_state``, e.g. when replaying a session log"""
+        # set the controls without their handlers, then rebuild once
+        boxes = (self.slab_mode_box, self.slab_thickness_box, self.cpr_offset_box)
+        for box in boxes:
+            box.blockSignals(True)
+        for index in range(self.slab_mode_box.count()):
+            if self.slab_mode_box.itemData(index) == state['slab_mode']:
+                self.slab_mode_box.setCurrentIndex(index)
+        self.slab_thickness_box.setValue(state['slab_thickness_mm'])
+        self.cpr_offset_box.setValue(state['cpr_offset_mm'])
+        for box in boxes:
+            box.blockSignals(False)
+        self.slab_mode = state['slab_mode']
+        self.slab_thickness_mm = state['slab_thickness_mm']
+        self.cpr_offset_mm = state['cpr_offset_mm']
+        self._build_slab_projectors()
+
+        if state['cpr_points'] is None:
+            self.close_cpr()
+        else:
+            if self.cpr is None:
+                self.toggle_cpr()
+            # re-renders the reformation on the next event loop tick
+            self.cpr_points_layer.data = np.asarray(state['cpr_points'], dtype=float)
+
+        linked = [(resolve_path(series['path']), series['colormap']) for series in state['linked_series']]
+        if linked != self.linked_sources:
+            self.clear_linked_series()
+            for path, colormap in linked:
+                reader = napari_get_reader(path)
+                if not reader:
+                    print(f"Cannot find file reader for linked series: {path}")
+                    continue
+                layer_data = reader(path, lazy=True, cache=self.volume_cache)
+                self.add_linked_series(path, layer_data[0][0], layer_data[0][1]['affine'], colormap=colormap)
+        self._update_slices(None)
+
+    def _log_session_state(self):
+        """Write the display state to the session log of a running recording"""
+        logger = getattr(self.recorder, 'session_logger', None)
+        if logger is not None:
+            logger.log('ui', **self.session_state())
+
+    def _build_slab_projectors(self):
+        """Create one slab projector per visible view for the current mode and thickness"""
+        self.slab_projectors = {}
+        if self.slab_mode is None:
+            return
+        spacing = self.metadata.get('metadata', {}).get('spacing')
+        for view in self.visible_views:
+            axis = VIEW_AXES[view]
+            voxel_size = float(spacing[axis]) if spacing is not None else 1.0
+            thickness = max(1, int(round(self.slab_thickness_mm / voxel_size)))
+            self.slab_projectors[view] = SlabProjector(self.slice_engine, view, thickness, self.slab_mode)
+
+    def _view_slice(self, view, index):
+        """Return the slice (or thick-slab projection) a view shows at ``index``"""
+        projector = self.slab_projectors.get(view)
+        if projector is not None:
+            return projector.get(index)
+        return self.slice_engine.get(view, index)
+
     def _setup_toolbar(self, filepath):
         # Status label and image name label
         self.status_label = QLabel("Recording status: Not recording")
@@ -327,9 +488,81 @@ class ViewerUI:
         )
 
 
+    def _prepare_volume(self, image_array, filepath):
+        """Return the array to display and its contrast limits"""
+        window = display_window(filepath, image_array)
+        if self.display_dtype is None:
+            return image_array, window
+        dtype = np.dtype(self.display_dtype)
+        suffix = f"_display_{dtype.name}.npy"
+        display = None
+        if self.volume_cache is not None:
+            # memory-mapped from the volume cache, so its pages can be dropped under memory pressure
+            display = self.volume_cache.load_array(filepath, suffix)
+            if display is None or display.shape != tuple(image_array.shape):
+                try:
+                    display = self.volume_cache.create_array(filepath, suffix, image_array.shape, dtype,
+                                                             lambda out: quantize_volume(image_array, window, dtype, out))
+                except OSError as e:
+                    print(f"Could not cache display copy of {filepath}: {str(e)}")
+                    display = None
+        if display is None:
+            display = quantize_volume(image_array, window, dtype)
+        return display, display_limits(window, dtype)
+
+    def load_volume(self, image_array, metadata, filepath):
+        """Swap the displayed volume in place, reusing the window and all layers"""
+        self.metadata = metadata
+        self.slice_engine.close()
+        self.close_cpr()
+        self.clear_linked_series()
+        self.filepath = filepath
+        if self.preview_3d is not None:
+            self.preview_3d.close()
+            self.preview_3d = None
+        self.image_array, self.contrast_limits = self._prepare_volume(image_array, filepath)
+        self.slice_engine = SliceEngine(self.image_array, views=self.visible_views, cache=self.volume_cache, path=filepath)
+        self._build_slab_projectors()
+        self.apply_layout_settings()
+
+        # replace the hidden 3D layer that drives the dims
+        index = self.viewer.layers.index(self.image_layer)
+        self.viewer.layers.remove(self.image_layer)
+        self.image_layer = self.viewer.add_image(self.image_array, **self.metadata, contrast_limits=self.contrast_limits, visible=False)
+        self.image_layer.editable = False
+        self.viewer.layers.move(self.viewer.layers.index(self.image_layer), index)
+
+        # drop annotations of the previous file
+        for layer in [l for l in self.viewer.layers if isinstance(l, napari.layers.Shapes) and l.name.startswith('add rectangle')]:
+            self.viewer.layers.remove(layer)
+        self.rect_metadata = {}
+        self.rect_list.clear()
+        self.annotation_edit.clear()
+
+        for view in self.visible_views:
+            getattr(self, f'{view}_layer').contrast_limits = self.contrast_limits
+            section_lines = getattr(self, f'section_lines_{view}')
+            section_lines.scale = getattr(self, f'{view}_layer').scale
+            section_lines.translate = getattr(self, f'{view}_layer').translate
+
+        # block the per-slider handlers while ranges change, then jump to the centre
+        for axis, dim_index in (('x', 2), ('y', 1), ('z', 0)):
+            slider = getattr(self, f'{axis}_slider')
+            max_value = self.image_array.shape[dim_index] - 1
+            slider.blockSignals(True)
+            slider.setRange(0, max_value)
+            slider.setValue(max_value // 2)
+            slider.blockSignals(False)
+            getattr(self, f'{axis}_label').setText(f"{axis.upper()}: {max_value // 2}/{max_value}")
+        self.viewer.dims.current_step = tuple(s // 2 for s in self.image_array.shape[:3])
+        self._update_slices(None)
+
+        self.file_name_label.setText(f"current file: {os.path.basename(filepath)}")
+        self.image_name_label.setText(f"Current Image: {os.path.basename(filepath)}")
+
     def _setup_layers(self):
         """Initialize image and points layers"""
-        self.image_layer = self.viewer.add_image(self.image_array, **self.metadata, visible=False)
+        self.image_layer = self.viewer.add_image(self.image_array, **self.metadata, contrast_limits=self.contrast_limits, visible=False)
         self.image_layer.editable = False  
         self._setup_ortho_views()
 
@@ -342,25 +575,15 @@ class ViewerUI:
         self.viewer.dims.current_step = (z, y, x)
         initial_z, initial_y, initial_x = self.viewer.dims.current_step
 
-        # Add orthogonal 2D slice layers
-        axial_slice = np.fliplr(np.rot90(self.image_array[initial_z, :, :], k=2))
-        # coronal_slice = np.fliplr(np.rot90(self.image_array[:, initial_y, :], k=2))
-        sagittal_slice = np.fliplr(np.rot90(self.image_array[:, :, initial_x], k=2))
-        print(f'axial_slice.shape={axial_slice.shape}, sagittal_slice.shape={sagittal_slice.shape}')
-
-        # set the layer parameters dynamically
-        if 'sagittal' in self.visible_views:
-            self.sagittal_layer = self.viewer.add_image(sagittal_slice, name='Sagittal')
-            self.sagittal_layer.scale = self.sagittal_base_scale[1:] 
-            self.sagittal_layer.translate = self.translate_offset['sagittal']
-        
-        if 'axial' in self.visible_views:
-            self.axial_layer = self.viewer.add_image(axial_slice, name='Axial')
-            self.axial_layer.scale = self.axial_base_scale[1:]    
-            self.axial_layer.translate = self.translate_offset['axial']
-
-        print(f'self.axial_layer.scale={self.axial_layer.scale}, self.axial_layer.translate={self.axial_layer.translate}')
-        print(f'self.sagittal_layer.scale={self.sagittal_layer.scale}, self.sagittal_layer.translate={self.sagittal_layer.translate}')
+        # Add orthogonal 2D slice layers, one per visible plane
+        for view in self.visible_views:
+            index = (initial_z, initial_y, initial_x)[VIEW_AXES[view]]
+            layer = self.viewer.add_image(self.slice_engine.get(view, index), name=view.capitalize(),
+                                          contrast_limits=self.contrast_limits)
+            layer.scale = self.base_scale[view][1:]
+            layer.translate = self.translate_offset[view]
+            setattr(self, f'{view}_layer', layer)
+            print(f'{view}: shape={layer.data.shape}, scale={layer.scale}, translate={layer.translate}')
         
         # set layout
         self.canvas = self.viewer.window.qt_viewer.canvas
@@ -369,67 +592,254 @@ class ViewerUI:
         self.coord_label = QLabel("Section Position: (0, 0)")
         self.slider_container.layout().insertWidget(2, self.coord_label)  
 
-        self.section_lines_sagittal = self.viewer.add_shapes(
-            name='Section Lines Sagittal',
-            shape_type='line',
-            edge_color='white',
-            edge_width=3,
-            scale=self.sagittal_layer.scale,
-            translate=self.sagittal_layer.translate,
-            visible=True
-        )
-        self.section_lines_axial = self.viewer.add_shapes(
-            name='Section Lines Axial',
-            shape_type='line',
-            edge_color='white',
-            edge_width=3,
-            scale=self.axial_layer.scale,
-            translate=self.axial_layer.translate,
-            visible=True
-        )
+        # each plane shows the positions of the other visible planes
+        for view in self.visible_views:
+            layer = getattr(self, f'{view}_layer')
+            section_lines = self.viewer.add_shapes(
+                name=f'Section Lines {view.capitalize()}',
+                shape_type='line',
+                edge_color='white',
+                edge_width=3,
+                scale=layer.scale,
+                translate=layer.translate,
+                visible=True
+            )
+            setattr(self, f'section_lines_{view}', section_lines)
 
 
     def _connect_events(self):
         """Connect event handlers"""
-        self.viewer.dims.events.current_step.connect(self._update_slices)
+        self._last_step = None
+        self._dirty_axes = set()
+        self._update_pending = False
+        self.viewer.dims.events.current_step.connect(self._on_step_changed)
+
+    def _on_step_changed(self, event):
+        """Record which axes moved and schedule one redraw for the next event loop tick"""
+        step = tuple(self.viewer.dims.current_step[:3])
+        if self._last_step is None:
+            self._dirty_axes.update((0, 1, 2))
+        else:
+            self._dirty_axes.update(i for i, (a, b) in enumerate(zip(step, self._last_step)) if a != b)
+        self._last_step = step
+        if self._dirty_axes and not self._update_pending:
+            # all step events of a slider drag that arrive before the timer fires share this redraw
+            self._update_pending = True
+            QTimer.singleShot(0, self._flush_updates)
+
+    def _flush_updates(self):
+        """Redraw the views affected by the axes that changed since the last redraw"""
+        axes, self._dirty_axes = self._dirty_axes, set()
+        self._update_pending = False
+        self._render_axes(axes)
 
     def _update_slices(self, event):
-        """Slice update logic"""
-        # z, y, x = viewer.dims.current_step
-        # z = self.image_array.shape[0] - np.clip(self.viewer.dims.current_step[0], 0, self.image_array.shape[0]-1) + 1
-        z = np.clip(self.viewer.dims.current_step[0], 0, self.image_array.shape[0]-1)
-        y = np.clip(self.viewer.dims.current_step[1], 0, self.image_array.shape[1]-1)
-        x = np.clip(self.viewer.dims.current_step[2], 0, self.image_array.shape[2]-1)
-
-        if 'sagittal' in self.visible_views:
-            sagittal_slice = np.fliplr(np.rot90(self.image_array[:, :, x], k=2))
-            self.sagittal_layer.data = sagittal_slice
-        
-        if 'axial' in self.visible_views:
-            axial_slice = np.fliplr(np.rot90(self.image_array[z, :, :], k=2))
-            self.axial_layer.data = axial_slice
-        
-        # refresh the display
-        self.axial_layer.refresh()  
-        # self.coronal_layer.refresh()
-        self.sagittal_layer.refresh()
+        """Slice update logic (redraws every view)"""
+        self._last_step = tuple(self.viewer.dims.current_step[:3])
+        self._render_axes({0, 1, 2})
 
-        current_z, current_y, current_x = self.viewer.dims.current_step
-        
-        line_data_axial = [
-            # Axial view horizontal line
-            [(0, current_x), (self.image_array.shape[1], current_x)],
-        ]
-        line_data_sagittal = [
-            # Sagittal view vertical line
-            [(self.image_array.shape[0]-current_z+1, 0), (self.image_array.shape[0]-current_z+1, self.image_array.shape[1])],
-        ]
-        
-        self.section_lines_axial.data = line_data_axial
-        self.section_lines_sagittal.data = line_data_sagittal
+    def _render_axes(self, axes):
+        """Update, in one pass, the plane images and section lines that depend on the changed axes"""
+        # z, y, x = viewer.dims.current_step
+        step = self.viewer.dims.current_step[:3]
+        shape = self.image_array.shape
+        for view in self.visible_views:
+            axis = VIEW_AXES[view]
+            if axis in axes:
+                index = np.clip(step[axis], 0, shape[axis]-1)
+                getattr(self, f'{view}_layer').data = self._view_slice(view, index)
+            if axes.intersection(DISPLAY_AXES[view]):
+                getattr(self, f'section_lines_{view}').data = self._section_lines(view, step)
+        self._render_linked(axes, step)
         # self.coord_label.setText(f"Section Position: Z:{current_z} Y:{current_y} X:{current_x}")
-        # print(f'current_z={current_z}, current_y={current_y}, current_x={current_x}')
+
+    def _section_lines(self, view, step):
+        """Lines marking the other visible planes on a view, in the view's data coordinates"""
+        row_axis, col_axis = DISPLAY_AXES[view]
+        shape = self.image_array.shape
+        lines = []
+        for other in self.visible_views:
+            axis = VIEW_AXES[other]
+            if axis == row_axis:
+                # rows are displayed flipped
+                row = shape[axis] - step[axis] + 1
+                lines.append([(row, 0), (row, shape[col_axis])])
+            elif axis == col_axis:
+                lines.append([(0, step[axis]), (shape[row_axis], step[axis])])
+        return lines
     
+    def add_linked_series(self, filepath, volume, affine, colormap='magenta'):
+        """Overlay another series of the study on every plane, following the current position"""
+        window = display_window(filepath, volume)
+        contrast_limits = window
+        if self.display_dtype is not None:
+            volume = quantize_volume(volume, window, self.display_dtype)
+            contrast_limits = display_limits(window, self.display_dtype)
+        series = LinkedSeries(os.path.basename(filepath), volume, affine,
+                              self.metadata['affine'], self.image_array.shape)
+        step = self.viewer.dims.current_step[:3]
+        layers = {}
+        for view in self.visible_views:
+            plane = getattr(self, f'{view}_layer')
+            layers[view] = self.viewer.add_image(
+                series.get(view, step[VIEW_AXES[view]]),
+                name=f'{series.name} ({view})',
+                colormap=colormap,
+                blending='additive',
+                opacity=0.5,
+                contrast_limits=contrast_limits,
+                scale=plane.scale,
+                translate=plane.translate,
+            )
+        self.linked_series.append((series, layers))
+        self.linked_sources.append((filepath, colormap))
+        if not hasattr(self, 'linked_label'):
+            self.linked_label = QLabel()
+            self.linked_label.setWordWrap(True)
+            self.slider_container.layout().addWidget(self.linked_label)
+        self._render_linked({0, 1, 2}, step)
+        self._log_session_state()
+
+    def clear_linked_series(self):
+        for series, layers in self.linked_series:
+            for layer in layers.values():
+                if layer in self.viewer.layers:
+                    self.viewer.layers.remove(layer)
+        self.linked_series = []
+        self.linked_sources = []
+        if hasattr(self, 'linked_label'):
+            self.linked_label.setText("")
+        self._log_session_state()
+
+    def _render_linked(self, axes, step):
+        """Resample the linked series onto the planes whose slice changed"""
+        if not self.linked_series:
+            return
+        positions = []
+        for series, layers in self.linked_series:
+            for view, layer in layers.items():
+                axis = VIEW_AXES[view]
+                if axis in axes:
+                    layer.data = series.get(view, np.clip(step[axis], 0, self.image_array.shape[axis]-1))
+            if series.contains(step):
+                z, y, x = np.round(series.map_point(step)).astype(int)
+                positions.append(f"{series.name}: Z:{z} Y:{y} X:{x}")
+            else:
+                positions.append(f"{series.name}: outside")
+        self.linked_label.setText("\n".join(positions))
+
+    def show_3d_preview(self):
+        """Open (or raise) the progressive 3D view of the current volume"""
+        if self.preview_3d is not None and self.preview_3d.is_open():
+            self.preview_3d.raise_window()
+            return
+        if self.preview_3d is not None:
+            self.preview_3d.close()
+        self.preview_3d = Preview3D(self.image_array, self.filepath,
+                                    spacing=self.metadata.get('metadata', {}).get('spacing'),
+                                    contrast_limits=self.contrast_limits,
+                                    cache=self.volume_cache,
+                                    surface_levels=self._surface_levels(),
+                                    window=self._quantized_window())
+
+    def _quantized_window(self):
+        """Window the displayed uint8 copy was quantized with, None if it holds the original values"""
+        if self.display_dtype is not None and np.dtype(self.display_dtype) == np.uint8:
+            return display_window(self.filepath, self.image_array)
+        return None
+
+    def _surface_levels(self):
+        """Iso levels of the surface presets, in the units of the displayed volume"""
+        percentiles = load_intensity_statistics(self.filepath, self.image_array)['percentiles']
+        levels = {name: percentiles[key] for name, key in SURFACE_PERCENTILES.items()}
+        window = self._quantized_window()
+        if window is not None:
+            low, high = window
+            levels = {name: float(np.clip((value - low) * 255.0 / (high - low), 1, 254)) for name, value in levels.items()}
+        return levels
+
+    def toggle_cpr(self):
+        """Show or hide the curved planar reformation next to the sagittal view"""
+        if self.cpr_layer is not None:
+            self.close_cpr()
+            return
+        spacing = self.metadata.get('metadata', {}).get('spacing')
+        spacing = np.ones(3) if spacing is None else np.asarray(spacing, dtype=float)
+        self.cpr = CurvedPlanarReformation(self.image_array, spacing=spacing)
+        centreline = estimate_centreline(self.cpr.volume)
+        if len(centreline) < 2:
+            print("Could not estimate a centreline, place points on the sagittal view")
+            z, y, x = (s // 2 for s in self.image_array.shape[:3])
+            centreline = np.array([[0, y, x], [self.image_array.shape[0] - 1, y, x]], dtype=float)
+        self.cpr_centreline = centreline
+
+        # control points live on the sagittal view: rows are flipped z, columns are y
+        nz = self.image_array.shape[0]
+        display_points = np.stack([nz - 1 - centreline[:, 0], centreline[:, 1]], axis=1)
+        self.cpr_points_layer = self.viewer.add_points(
+            display_points,
+            name='CPR Centreline',
+            size=4,
+            face_color='yellow',
+            scale=self.sagittal_layer.scale,
+            translate=self.sagittal_layer.translate,
+        )
+        # the straightened image sits right of all plane views, at the sagittal zoom
+        sagittal_scale = np.asarray(self.sagittal_layer.scale)
+        right = max(getattr(self, f'{view}_layer').translate[1]
+                    + getattr(self, f'{view}_layer').data.shape[1] * getattr(self, f'{view}_layer').scale[1]
+                    for view in self.visible_views)
+        cpr_scale = sagittal_scale * self.cpr.step_mm / spacing[1]
+        self.cpr_layer = self.viewer.add_image(
+            self.cpr.render(centreline, self.cpr_offset_mm)[::-1],
+            name='CPR',
+            contrast_limits=self.contrast_limits,
+            scale=cpr_scale,
+            translate=(self.sagittal_layer.translate[0], right + 20),
+        )
+        self._cpr_pending = False
+        self.cpr_points_layer.events.data.connect(self._on_cpr_points_changed)
+        self._log_session_state()
+
+    def close_cpr(self):
+        for layer in (self.cpr_points_layer, self.cpr_layer):
+            if layer is not None and layer in self.viewer.layers:
+                self.viewer.layers.remove(layer)
+        self.cpr = self.cpr_points_layer = self.cpr_layer = None
+        self._log_session_state()
+
+    def _on_cpr_points_changed(self, event):
+        # a point drag emits many data events, re-render once per event loop tick
+        if not self._cpr_pending:
+            self._cpr_pending = True
+            QTimer.singleShot(0, self._update_cpr)
+
+    def _on_cpr_offset_changed(self, value):
+        self.cpr_offset_mm = value
+        if self.cpr is not None:
+            self._on_cpr_points_changed(None)  # logged with the re-render
+        else:
+            self._log_session_state()
+
+    def _update_cpr(self):
+        """Re-render the reformation from the edited control points"""
+        self._cpr_pending = False
+        if self.cpr is None:
+            return
+        self._log_session_state()
+        if len(self.cpr_points_layer.data) < 2:
+            return
+        nz = self.image_array.shape[0]
+        data = np.asarray(self.cpr_points_layer.data)
+        z = nz - 1 - data[:, 0]
+        # the sagittal view has no left-right coordinate, follow the estimated canal instead
+        order = np.argsort(self.cpr_centreline[:, 0])
+        x = np.interp(z, self.cpr_centreline[order, 0], self.cpr_centreline[order, 2])
+        try:
+            self.cpr_layer.data = self.cpr.render(np.stack([z, data[:, 1], x], axis=1), self.cpr_offset_mm)[::-1]
+        except ValueError as e:
+            print(f"Curved reformation failed: {str(e)}")
+
     def toggle_audio_recording(self):
         """Toggle audio recording status"""
         if not self.audio_recording:
@@ -1,5 +1,6 @@
 from flask import Flask, request, jsonify, render_template, url_for
 import os
+import sys
 import nibabel as nib
 import matplotlib.pyplot as plt
 import numpy as np
@@ -8,6 +9,9 @@ import base64
 import re
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.intensity import display_window
+
 app = Flask(__name__)
 
 # Ensure upload directories exist
@@ -25,7 +29,10 @@ def process_nifti(filepath, output_dir, slice_x=None, slice_y=None, slice_z=None
     """Process NIfTI file and generate images"""
     # Load NIfTI file
     img = nib.load(filepath)
-    data = img.get_fdata()
+    # native dtype (int16 for most MRI) instead of get_fdata()'s float64, slices are converted when windowed
+    data = np.asanyarray(img.dataobj)
+    # Cached per-volume window, identical for every slice
+    window_min, window_max = display_window(filepath, data)
     
     # Use middle slice if no slice index provided
     if slice_x is None:
@@ -53,12 +60,11 @@ def process_nifti(filepath, output_dir, slice_x=None, slice_y=None, slice_z=None
     for name, slice_data, slice_index in slices:
         # Normalize data for display
         slice_data = slice_data.T  # Transpose for correct orientation
-        if slice_data.max() > 0:
-            slice_data = (slice_data / slice_data.max()) * 255
+        slice_data = np.clip((slice_data - window_min) / (window_max - window_min), 0, 1) * 255
         
         # Create image
         plt.figure(figsize=(10, 10))
-        plt.imshow(slice_data, cmap='gray')
+        plt.imshow(slice_data, cmap='gray', vmin=0, vmax=255)
         plt.axis('off')
         
         # Save image
@@ -119,7 +125,8 @@ def process_prompt():
     
     # Get current slice images
     img = nib.load(filepath)
-    data_array = img.get_fdata()
+    data_array = np.asanyarray(img.dataobj)
+    window_min, window_max = display_window(filepath, data_array)
     
     # Get slices in three directions
     slices = [
@@ -132,11 +139,10 @@ def process_prompt():
     encoded_images = []
     for name, slice_data in slices:
         # Normalize data for display
-        if slice_data.max() > 0:
-            slice_data = (slice_data / slice_data.max()) * 255
+        slice_data = np.clip((slice_data - window_min) / (window_max - window_min), 0, 1) * 255
         
         plt.figure(figsize=(20, 20), dpi=300)
-        plt.imshow(slice_data, cmap='gray', interpolation='none')
+        plt.imshow(slice_data, cmap='gray', vmin=0, vmax=255, interpolation='none')
         plt.axis('off')
         
         buffer = BytesIO()